@@ -1,16 +1,18 @@
 # Standard Python libraries
-import time
+import concurrent.futures
 
 # Third-party libraries
 import requests
 
 # Local libraries
+import so4t_rate_limit
 import so4t_request_validate
 
 
 class V2Client(object):
 
-    def __init__(self, url, key=None, token=None):
+    def __init__(self, url, key=None, token=None, session=None, pool_size=10,
+                 rate_limiter=None, max_workers=4, response_cache=None, checkpoint=None):
 
         print("Initializing API v2.3 client...")
 
@@ -46,8 +48,32 @@ class V2Client(object):
                 print("Missing required argument. Please provide an API key.")
                 raise SystemExit
 
-        # Test the API connection and set the SSL verification variable
-        self.ssl_verify = self.test_connection()
+        # Connections are kept alive and reused for every API call. The session can be shared
+        # with the V3Client, in which case the SSL verification setting is shared as well.
+        self.session = session or so4t_request_validate.create_session(pool_size)
+
+        # Progress of each crawl is saved to the checkpoint, if there is one (see so4t_checkpoint.py)
+        self.checkpoint = checkpoint
+
+        # Set when an API call fails, which ends its crawl early, so the data is incomplete
+        self.failed = False
+
+        # API responses can be cached on disk (see so4t_response_cache.py). When replaying
+        # recorded responses, the API isn't called at all, so the connection isn't tested.
+        self.response_cache = response_cache
+        if self.response_cache and self.response_cache.mode == 'replay':
+            print("Replaying recorded API responses. Skipping API connection test.")
+            self.ssl_verify = True
+        else:
+            # Test the API connection and set the SSL verification variable
+            self.ssl_verify = self.test_connection()
+            self.session.verify = self.ssl_verify
+
+        # Every API call waits for the rate limiter, which can be shared with the V3Client
+        self.rate_limiter = rate_limiter or so4t_rate_limit.RateLimiter()
+
+        # Maximum number of concurrent API calls, for endpoints that are called in batches
+        self.max_workers = max_workers
 
 
     def test_connection(self):
@@ -64,10 +90,10 @@ class V2Client(object):
 
         print("Testing API 2.3 connection...")
         try:
-            response = requests.get(url, params=params, headers=headers)
+            response = self.session.get(url, params=params, headers=headers)
         except requests.exceptions.SSLError:
             print("SSL error. Trying again without SSL verification...")
-            response = requests.get(url, params=params, headers=headers, verify=False)
+            response = self.session.get(url, params=params, headers=headers, verify=False)
             ssl_verify = False
         
         if response.status_code == 200:
@@ -106,7 +132,8 @@ class V2Client(object):
         return filter_string
 
 
-    def get_all_questions(self, filter_string='', fromdate=None, todate=None):
+    def get_all_questions(self, filter_string='', fromdate=None, todate=None, sliced=False,
+                          keyset=False, activity_since=None):
 
         # API endpoint documentation: https://api.stackexchange.com/docs/questions
         endpoint = "/questions"
@@ -122,11 +149,19 @@ class V2Client(object):
             params['fromdate'] = fromdate
         if todate:
             params['todate'] = todate
-    
+
+        if activity_since:
+            return self.get_items_since(endpoint_url, params, 'activity', activity_since)
+        if sliced:
+            return self.get_items_in_slices(endpoint_url, params, 'question_id', fromdate, todate,
+                                            keyset)
+        if keyset:
+            return self.get_items_by_keyset(endpoint_url, params, 'question_id')
         return self.get_items(endpoint_url, params)
 
 
-    def get_all_articles(self, filter_string='', fromdate=None, todate=None):
+    def get_all_articles(self, filter_string='', fromdate=None, todate=None, sliced=False,
+                         keyset=False, activity_since=None):
 
         # API endpoint documentation: https://api.stackexchange.com/docs/articles
         endpoint = "/articles"
@@ -143,10 +178,19 @@ class V2Client(object):
         if todate:
             params['todate'] = todate
 
+        if activity_since:
+            return self.get_items_since(endpoint_url, params, 'activity', activity_since)
+        if sliced:
+            return self.get_items_in_slices(endpoint_url, params, 'article_id', fromdate, todate,
+                                            keyset)
+        if keyset:
+            return self.get_items_by_keyset(endpoint_url, params, 'article_id')
         return self.get_items(endpoint_url, params)
     
 
-    def get_all_users(self, filter_string=''):
+    def get_all_users(self, filter_string='', keyset=False, stop_when=None, modified_since=None):
+        # stop_when(users) can stop the API calls early, once it returns True for the users
+        # received so far
         
         # API endpoint documentation: https://api.stackexchange.com/docs/users
         endpoint = "/users"
@@ -159,10 +203,56 @@ class V2Client(object):
         if filter_string:
             params['filter'] = filter_string
 
-        return self.get_items(endpoint_url, params)
+        if modified_since:
+            return self.get_items_since(endpoint_url, params, 'modified', modified_since)
+        if keyset:
+            return self.get_items_by_keyset(endpoint_url, params, 'user_id', stop_when)
+
+        # Users with the highest reputation come first (the API's default order)
+        params['sort'] = 'reputation'
+        params['order'] = 'desc'
+        return self.get_items(endpoint_url, params, stop_when)
+
+
+    def get_user_count(self):
+
+        return self.get_total(self.api_url + "/users", {})
+
+
+    def get_users_by_ids(self, user_ids, filter_string='', modified_since=None):
+
+        # API endpoint documentation: https://api.stackexchange.com/docs/users-by-ids
+        # User IDs are sent in batches of 100, semicolon-separated, and fetched concurrently
+        batch_size = 100
+        user_ids = [str(user_id) for user_id in user_ids]
+        user_id_batches = [user_ids[i:i + batch_size] for i in range(0, len(user_ids), batch_size)]
+
+        def get_batch(batch):
+            endpoint = f"/users/{';'.join(batch)}"
+            endpoint_url = self.api_url + endpoint
+
+            params = {
+                'page': 1,
+                'pagesize': 100,
+            }
+            if filter_string:
+                params['filter'] = filter_string
+
+            if modified_since:
+                batch_users = self.get_items_since(endpoint_url, params, 'modified', modified_since)
+            else:
+                batch_users = self.get_items(endpoint_url, params)
+            return sorted(batch_users, key=lambda user: user['user_id'])
+
+        users = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch_users in executor.map(get_batch, user_id_batches):
+                users += batch_users
+
+        return users
     
 
-    def get_reputation_history(self, user_ids, filter_string=''):
+    def get_reputation_history(self, user_ids, filter_string='', since=None):
 
         # API endpoint documentation: https://api.stackexchange.com/docs/reputation-history
         # Documentation says User IDs need to be sent in batches of 100, semicolon-separated
@@ -172,8 +262,7 @@ class V2Client(object):
         user_ids = [str(user_id) for user_id in user_ids]
         user_id_batches = [user_ids[i:i + batch_size] for i in range(0, len(user_ids), batch_size)]
 
-        reputation_history = []
-        for batch in user_id_batches:
+        def get_batch(batch):
             user_id_string = ';'.join(batch) # Convert list of user IDs into a string
             endpoint = f"/users/{user_id_string}/reputation-history"
             endpoint_url = self.api_url + endpoint
@@ -185,34 +274,288 @@ class V2Client(object):
             if filter_string:
                 params['filter'] = filter_string
 
-            reputation_history += self.get_items(endpoint_url, params)
-            
-            # Add delay between batches to avoid rate limiting
-            time.sleep(0.5)  # 500ms delay between batches
+            if since is None:
+                return self.get_items(endpoint_url, params)
+
+            # Events are returned newest first, so stop once events from before 'since' are
+            # received
+            events = self.get_items(endpoint_url, params,
+                                    stop_when=lambda events: events[-1]['creation_date'] < since)
+            return [event for event in events if event['creation_date'] >= since]
+
+        # Batches are fetched concurrently, with every API call still paced by the rate limiter
+        # (including backoff requests). Results are combined in batch order, the same as fetching
+        # the batches one at a time.
+        reputation_history = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch_history in executor.map(get_batch, user_id_batches):
+                reputation_history += batch_history
 
         return reputation_history
     
 
-    def get_items(self, endpoint_url, params):
-        
-        # SO Business and Basic require a team slug parameter
-        if not self.soe:
-            params['team'] = self.team_slug
+    def get_items(self, endpoint_url, params, stop_when=None):
+
+        # Continue from the last page saved to the checkpoint, if a previous run saved any
+        crawl_params = dict(params)
+        items, params = self.resume_crawl(endpoint_url, params)
+        if params is None: # the crawl was already complete
+            return items
 
-        items = []
         while True: # Keep performing API calls until all items are received
             if params.get('page'):
                 print(f"Getting page {params['page']} from {endpoint_url}")
             else:
                 print(f"Getting data from {endpoint_url}")
+
+            response_json = self.send_request(endpoint_url, params)
+            if response_json is None: # the API call failed
+                break
+            page_items = response_json.get('items')
+            items += page_items
+
+            done = not response_json.get('has_more') or (stop_when and stop_when(items))
+            self.save_progress(endpoint_url, crawl_params, page_items,
+                               None if done else {'page': params['page'] + 1})
+            if done:
+                break
+
+            params['page'] += 1
+
+        return items
+
+
+    def resume_crawl(self, endpoint_url, params):
+        '''
+        Returns the items already received by a crawl, according to the checkpoint, and the
+        params to continue the crawl with. The params are None if the crawl was complete.
+        '''
+        records = self.checkpoint.load(endpoint_url, params) if self.checkpoint else []
+        if not records:
+            return [], params
+
+        items = [item for record in records for item in record['items']]
+        if records[-1]['next'] is None:
+            print(f"Using {len(items)} items from {endpoint_url} saved by a previous run")
+            return items, None
+
+        print(f"Resuming {endpoint_url} after {len(items)} items saved by a previous run")
+        return items, dict(params, **records[-1]['next'])
+
+
+    def save_progress(self, endpoint_url, crawl_params, page_items, next_params):
+        '''
+        Saves a page of items to the checkpoint, with the params to get the next page (or None
+        if the crawl is complete)
+        '''
+        if self.checkpoint:
+            self.checkpoint.save(endpoint_url, crawl_params,
+                                 {'items': page_items, 'next': next_params})
+
+
+    def get_items_since(self, endpoint_url, params, sort, since):
+        '''
+        Gets the items whose sort field (e.g. last_activity_date when sorting by 'activity') is
+        on or after 'since', most recent first. The 'min' parameter applies to the sort field, so
+        the API stops returning items once it reaches older ones.
+        '''
+        params = dict(params, page=1, sort=sort, order='desc', min=since)
+
+        return self.get_items(endpoint_url, params)
+
+
+    def get_items_by_keyset(self, endpoint_url, params, id_field, stop_when=None):
+        '''
+        Gets all items in order of creation, using the creation date of the last item received
+        as the minimum creation date of the next API call (instead of a page number). Unlike
+        deep page numbers, which get slower the further into the results they are, every API
+        call costs the same.
+        '''
+        params = dict(params, page=1, sort='creation', order='asc')
+
+        # Continue from the last page saved to the checkpoint, if a previous run saved any
+        crawl_params = dict(params)
+        saved_items, params = self.resume_crawl(endpoint_url, params)
+
+        # Items created on the minimum date of an API call were already received by the
+        # previous API call
+        items = []
+        item_ids = set()
+        for item in saved_items:
+            if item[id_field] not in item_ids:
+                item_ids.add(item[id_field])
+                items.append(item)
+        if params is None: # the crawl was already complete
+            return items
+
+        while True:
+            print(f"Getting items created since {params.get('min', 'the start')} from "
+                  f"{endpoint_url}")
+            response_json = self.send_request(endpoint_url, params)
+            if response_json is None: # the API call failed
+                break
+
+            page_items = response_json.get('items')
+            for item in page_items:
+                if item[id_field] not in item_ids:
+                    item_ids.add(item[id_field])
+                    items.append(item)
+
+            if not response_json.get('has_more') or (stop_when and stop_when(items)):
+                self.save_progress(endpoint_url, crawl_params, page_items, None)
+                break
+
+            last_date = page_items[-1]['creation_date']
+            if last_date > params.get('min', -1):
+                params['min'] = last_date
+                params['page'] = 1
+            else: # a full page of items has the same creation date, so page within that date
+                params['page'] += 1
+            self.save_progress(endpoint_url, crawl_params, page_items,
+                               {'min': params['min'], 'page': params['page']})
+
+        return items
+
+
+    def get_items_in_slices(self, endpoint_url, params, id_field, fromdate=None, todate=None,
+                            keyset=False):
+        '''
+        Gets all items created between fromdate and todate by splitting the date range into
+        slices of roughly equal item counts, and crawling the slices concurrently. Items are
+        returned in order of creation, without duplicates.
+        '''
+        # The slices are saved to the checkpoint, since a resumed crawl needs the same slices to
+        # find the progress saved for each one
+        slices_key = dict(params, slices_fromdate=fromdate, slices_todate=todate)
+        records = self.checkpoint.load(endpoint_url, slices_key) if self.checkpoint else []
+        if records:
+            slices = [tuple(date_slice) for date_slice in records[0]['slices']]
+        else:
+            todate = todate or self.get_latest_creation_date(endpoint_url, params)
+            slices = self.get_date_slices(endpoint_url, params, fromdate or 0, todate)
+            if slices and not slices_key['slices_todate']:
+                # The last slice has no todate, so items created during the crawl are included
+                slices[-1] = (slices[-1][0], None)
+            if self.checkpoint:
+                self.checkpoint.save(endpoint_url, slices_key, {'slices': slices})
+        print(f"Getting {endpoint_url} in {len(slices)} date slices...")
+
+        def get_slice(date_slice):
+            slice_params = dict(params, page=1, sort='creation', order='asc',
+                                fromdate=date_slice[0])
+            if date_slice[1] is not None:
+                slice_params['todate'] = date_slice[1]
+            if keyset:
+                return self.get_items_by_keyset(endpoint_url, slice_params, id_field)
+            return self.get_items(endpoint_url, slice_params)
+
+        # Slices share their boundary dates, so items created exactly on a boundary can be
+        # returned by both slices
+        items = []
+        item_ids = set()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for slice_items in executor.map(get_slice, slices):
+                for item in slice_items:
+                    if item[id_field] not in item_ids:
+                        item_ids.add(item[id_field])
+                        items.append(item)
+
+        return items
+
+
+    def get_date_slices(self, endpoint_url, params, fromdate, todate, slice_size=1000):
+        '''
+        Splits the date range in half until each part has no more than slice_size items, using
+        the 'total' filter to count the items in each part. Parts without items are dropped.
+        Returns a list of (fromdate, todate) tuples, in date order.
+        '''
+        slices = []
+        pending = [(fromdate, todate)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending:
+                totals = executor.map(lambda part: self.get_total(endpoint_url, params, *part),
+                                      pending)
+                next_pending = []
+                for (start, end), total in zip(pending, totals):
+                    if total <= slice_size or end - start <= 1:
+                        if total:
+                            slices.append((start, end))
+                    else:
+                        middle = (start + end) // 2
+                        next_pending += [(start, middle), (middle, end)]
+                pending = next_pending
+
+        return sorted(slices)
+
+
+    def get_latest_creation_date(self, endpoint_url, params):
+        '''
+        Returns the creation date of the newest item, plus one second, to use as the end of the
+        date range to slice. Unlike the current time, it's the same from one run to the next, so
+        the API calls can be cached and replayed. Returns 0 if there are no items.
+        '''
+        latest_params = {key: value for key, value in params.items()
+                         if key not in ['page', 'pagesize', 'filter']}
+        latest_params.update(sort='creation', order='desc', pagesize=1)
+        response_json = self.send_request(endpoint_url, latest_params)
+        if response_json is None:
+            print(f"Unable to get the newest item from {endpoint_url}")
+            raise SystemExit
+        if not response_json['items']:
+            return 0
+
+        return response_json['items'][0]['creation_date'] + 1
+
+
+    def get_total(self, endpoint_url, params, fromdate=None, todate=None):
+
+        # The built-in 'total' filter only returns the number of matching items
+        total_params = {key: value for key, value in params.items()
+                        if key not in ['page', 'pagesize', 'filter']}
+        total_params['filter'] = 'total'
+        if fromdate is not None:
+            total_params['fromdate'] = fromdate
+        if todate is not None:
+            total_params['todate'] = todate
+        response_json = self.send_request(endpoint_url, total_params)
+        if response_json is None:
+            print(f"Unable to count items from {endpoint_url}")
+            raise SystemExit
+
+        return response_json['total']
+
+
+    def send_request(self, endpoint_url, params):
+        '''
+        Sends a single API call, waiting for the rate limiter first, and retries it if it fails
+        or is throttled. Returns the JSON response, or None if the API call failed.
+        '''
+        # SO Business and Basic require a team slug parameter
+        if not self.soe:
+            params['team'] = self.team_slug
+
+        if self.response_cache:
+            cached_response = self.response_cache.get('get', endpoint_url, params)
+            if cached_response:
+                return cached_response.json()
+
+        throttle_retries = 0
+        while True:
+            self.rate_limiter.acquire()
             try:
-                response = requests.get(endpoint_url, headers=self.headers, params=params,
-                                        verify=self.ssl_verify,
-                                        timeout=so4t_request_validate.timeout)
+                response = self.session.get(endpoint_url, headers=self.headers, params=params,
+                                            verify=self.ssl_verify,
+                                            timeout=so4t_request_validate.timeout)
             except Exception as ex:
                 so4t_request_validate.handle_except(ex)
                 continue
 
+            if is_throttle_violation(response):
+                throttle_retries += 1
+                self.rate_limiter.throttle_violation(response.json().get('error_message'),
+                                                     attempt=throttle_retries)
+                continue # retry the same request
+
             if response.status_code != 200:
                 # Many API call failures result in an HTTP 400 status code (Bad Request)
                 # To understand the reason for the 400 error, specific API error codes can be 
@@ -220,32 +563,39 @@ class V2Client(object):
                 print(f"/{endpoint_url} API call failed with status code: {response.status_code}.")
                 print(response.text)
                 print(f"Failed request URL and params: {response.request.url}")
-                break
-            
+                self.failed = True
+                return None
+
             try:
-                items += response.json().get('items')
+                response_json = response.json()
             except requests.exceptions.JSONDecodeError:
                 print(f"Unexpected response from {endpoint_url}")
                 print(f"Expected JSON response, but received this instead: {response.text}")
                 raise SystemExit
 
-            if not response.json().get('has_more'):
-                break
-
-            # If the endpoint gets overloaded, it will send a backoff request in the response
-            # Failure to backoff will result in a 502 error (throttle_violation)
+            # The rate limiter adapts to the backoff field of each response, and stops requests
+            # if quota_remaining runs out
             # Rate limiting documentation: https://api.stackexchange.com/docs/throttle
-            if response.json().get('backoff'):
-                backoff_time = response.json().get('backoff') + 1
-                so4t_request_validate.last_api_backoff = backoff_time
-                print(f"API backoff request received. Waiting {backoff_time} seconds...")
-                time.sleep(backoff_time)
-            else:
-                so4t_request_validate.last_api_backoff = 0
-                # Add small delay between successful requests to prevent rate limiting
-                time.sleep(0.1)  # 100ms delay
+            so4t_request_validate.last_api_backoff = \
+                self.rate_limiter.update_from_v2(response_json)
 
-            params['page'] += 1
+            if self.response_cache:
+                self.response_cache.put('get', endpoint_url, params, response)
 
-        return items
-  
\ No newline at end of file
+            return response_json
+
+
+def is_throttle_violation(response):
+    '''
+    Sending requests too quickly, or ignoring a backoff, results in a throttle_violation error
+    (error ID 502). The API returns it with an HTTP 400 status code, like other API errors, so
+    the error in the response body is checked whatever the status code.
+    '''
+    if response.status_code == 200:
+        return False
+    try:
+        error = response.json()
+    except requests.exceptions.JSONDecodeError:
+        return False
+
+    return error.get('error_name') == 'throttle_violation' or error.get('error_id') == 502
@@ -1,17 +1,19 @@
 # Standard Python libraries
+import concurrent.futures
 import json
-import time
 
 # Third-party libraries
 import requests
 
 # Local libraries
+import so4t_rate_limit
 import so4t_request_validate
 
 
 class V3Client(object):
 
-    def __init__(self, url, token):
+    def __init__(self, url, token, session=None, pool_size=10, rate_limiter=None,
+                 max_workers=4, response_cache=None, checkpoint=None):
 
         print("Initializing API v3 client...")
 
@@ -35,7 +37,28 @@ class V3Client(object):
         else: # Stack Internal (Enterprise)
             self.api_url = url + "/api/v3"
 
-        self.ssl_verify = self.test_connection() # test the API connection
+        # Connections are kept alive and reused for every API call. If the session is shared with
+        # the V2Client, and SSL verification already failed there, it's not tested again.
+        self.session = session or so4t_request_validate.create_session(pool_size)
+
+        # Progress of each crawl is saved to the checkpoint, if there is one (see so4t_checkpoint.py)
+        self.checkpoint = checkpoint
+
+        # API responses can be cached on disk (see so4t_response_cache.py). When replaying
+        # recorded responses, the API isn't called at all, so the connection isn't tested.
+        self.response_cache = response_cache
+        if self.response_cache and self.response_cache.mode == 'replay':
+            print("Replaying recorded API responses. Skipping API connection test.")
+            self.ssl_verify = True
+        else:
+            self.ssl_verify = self.test_connection() # test the API connection
+            self.session.verify = self.ssl_verify
+
+        # Every API call waits for the rate limiter, which can be shared with the V2Client
+        self.rate_limiter = rate_limiter or so4t_rate_limit.RateLimiter()
+
+        # Maximum number of concurrent API calls, when fetching pages after the first
+        self.max_workers = max_workers
 
     
     def test_connection(self):
@@ -45,12 +68,16 @@ class V3Client(object):
         ssl_verify = True
 
         print("Testing API v3 connection...")
-        try:
-            response = requests.get(endpoint_url, headers=self.headers)
-        except requests.exceptions.SSLError:
-            print("SSL error. Trying again without SSL verification...")
-            response = requests.get(endpoint_url, headers=self.headers, verify=False)
+        if self.session.verify is False: # SSL verification already failed for a shared session
             ssl_verify = False
+            response = self.session.get(endpoint_url, headers=self.headers, verify=False)
+        else:
+            try:
+                response = self.session.get(endpoint_url, headers=self.headers)
+            except requests.exceptions.SSLError:
+                print("SSL error. Trying again without SSL verification...")
+                response = self.session.get(endpoint_url, headers=self.headers, verify=False)
+                ssl_verify = False
         
         if response.status_code == 200:
             print("API connection successful")
@@ -97,6 +124,15 @@ class V3Client(object):
         return smes
 
 
+    def get_user_group(self, group_id):
+
+        method = "get"
+        endpoint = f"/user-groups/{group_id}"
+        user_group = self.send_api_call(method, endpoint)
+
+        return user_group
+
+
     def get_user(self, user_id):
 
         method = "get"
@@ -119,13 +155,106 @@ class V3Client(object):
             return users
 
 
+    def get_user_count(self):
+
+        # Only the first page is needed, which includes the total number of users
+        response = self.send_request('get', self.api_url + "/users", {'page': 1, 'pagesize': 1})
+
+        return response.json()['totalCount']
+
+
     def send_api_call(self, method, endpoint, params={}):
 
-        get_response = getattr(requests, method, None) # get the method from the requests library
         endpoint_url = self.api_url + endpoint
 
-        data = []
+        # Progress of GET requests is saved to the checkpoint, if there is one, so the results
+        # saved by a previous run can be used instead of calling the API again
+        checkpoint = self.checkpoint if method == 'get' else None
+        records = checkpoint.load(endpoint_url, params) if checkpoint else []
+
+        if type(params) == dict and params.get('page'): # check request for pagination
+            pages = {record['page']: record for record in records}
+            if params['page'] in pages:
+                print(f"Using {len(pages)} pages from {endpoint_url} saved by a previous run")
+                total_pages = pages[params['page']]['total_pages']
+            else:
+                response = self.send_request(method, endpoint_url, params)
+                try:
+                    json_data = response.json()
+                except json.decoder.JSONDecodeError: # some API calls do not return JSON data
+                    print(f"API request successfully sent to {endpoint_url}")
+                    return
+                print(f"Received page {params['page']} from {endpoint_url}")
+                total_pages = json_data['totalPages']
+                pages[params['page']] = self.save_page(endpoint_url, params, params['page'],
+                                                       json_data['items'], total_pages)
+
+            # The first page gives the total number of pages, so the remaining pages are fetched
+            # concurrently, and combined in page order
+            def get_page(page):
+                page_response = self.send_request(method, endpoint_url, dict(params, page=page))
+                try:
+                    page_json = page_response.json()
+                except json.decoder.JSONDecodeError:
+                    return None # handled below, the same as the first page
+                print(f"Received page {page} from {endpoint_url}")
+                return self.save_page(endpoint_url, params, page, page_json['items'], total_pages)
+
+            remaining_pages = [page for page in range(params['page'] + 1, total_pages + 1)
+                               if page not in pages]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for record in executor.map(get_page, remaining_pages):
+                    if record is None: # some API calls do not return JSON data
+                        print(f"API request successfully sent to {endpoint_url}")
+                        return
+                    pages[record['page']] = record
+
+            data = []
+            for page in sorted(pages):
+                data += pages[page]['items']
+        elif records:
+            data = records[-1]['data']
+        else:
+            response = self.send_request(method, endpoint_url, params)
+            try:
+                json_data = response.json()
+            except json.decoder.JSONDecodeError: # some API calls do not return JSON data
+                print(f"API request successfully sent to {endpoint_url}")
+                return
+
+            print(f"API request successfully sent to {endpoint_url}")
+            data = json_data
+            if checkpoint:
+                checkpoint.save(endpoint_url, params, {'data': data})
+
+        return data
+
+
+    def save_page(self, endpoint_url, params, page, items, total_pages):
+
+        record = {'page': page, 'items': items, 'total_pages': total_pages}
+        if self.checkpoint:
+            self.checkpoint.save(endpoint_url, params, record)
+
+        return record
+
+
+    def send_request(self, method, endpoint_url, params):
+        '''
+        Sends a single API call, waiting for the rate limiter first, and retries it if it fails
+        or is throttled. Returns the response.
+        '''
+        get_response = getattr(self.session, method, None) # get the method from the session
+
+        use_cache = self.response_cache and method == 'get' # only GET requests are cached
+        if use_cache:
+            cached_response = self.response_cache.get(method, endpoint_url, params)
+            if cached_response:
+                return cached_response
+
+        throttle_retries = 0
         while True:
+            self.rate_limiter.acquire()
             try:
                 if method == 'get':
                     response = get_response(endpoint_url, headers=self.headers, params=params,
@@ -139,41 +268,23 @@ class V3Client(object):
                 so4t_request_validate.handle_except(ex)
                 continue
 
+            if response.status_code == 429: # too many requests
+                retry_after = response.headers.get('retry-after', '')
+                throttle_retries += 1
+                self.rate_limiter.throttle_violation(
+                    default_wait=int(retry_after) + 1 if retry_after.isdigit() else 30,
+                    attempt=throttle_retries)
+                continue # retry the same request
+
             if response.status_code not in [200, 201, 204]:
                 print(f"API call to {endpoint_url} failed with status code {response.status_code}")
                 print(f"Response from server: {response.text}")
                 raise SystemExit
 
-            # Respect v3 throttle headers to avoid being blocked
-            burst_left = response.headers.get('x-burst-throttle-calls-left')
-            if burst_left is not None and int(burst_left) < 5:
-                burst_wait = int(response.headers.get('x-burst-throttle-seconds-until-full', 2))
-                print(f"Approaching burst throttle limit ({burst_left} calls left). "
-                      f"Waiting {burst_wait} seconds...")
-                time.sleep(burst_wait)
-
-            bucket_left = response.headers.get('x-token-bucket-calls-left')
-            if bucket_left is not None and int(bucket_left) < 100:
-                bucket_wait = int(response.headers.get('x-token-bucket-seconds-until-next-refill', 60))
-                print(f"Token bucket running low ({bucket_left} tokens left). "
-                      f"Waiting {bucket_wait} seconds for refill...")
-                time.sleep(bucket_wait)
+            # The rate limiter adapts to the v3 throttle headers, to avoid being blocked
+            self.rate_limiter.update_from_v3(response.headers)
 
-            try:
-                json_data = response.json()
-            except json.decoder.JSONDecodeError: # some API calls do not return JSON data
-                print(f"API request successfully sent to {endpoint_url}")
-                return
+            if use_cache:
+                self.response_cache.put(method, endpoint_url, params, response)
 
-            if type(params) == dict and params.get('page'): # check request for pagination
-                print(f"Received page {params['page']} from {endpoint_url}")
-                data += json_data['items']
-                if params['page'] == json_data['totalPages']:
-                    break
-                params['page'] += 1
-            else:
-                print(f"API request successfully sent to {endpoint_url}")
-                data = json_data
-                break
-
-        return data
+            return response
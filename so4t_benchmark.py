@@ -0,0 +1,227 @@
+'''
+Times each stage of the user report on synthetic datasets of increasing size, and records the peak
+memory used. Useful for catching performance regressions and comparing the python and numpy
+engines.
+'''
+
+# Standard Python libraries
+import argparse
+import concurrent.futures
+import gc
+import json
+import os
+import time
+import tracemalloc
+
+# Local libraries
+import so4t_synthetic_data
+import so4t_user_report
+
+try:
+    import resource # only available on Unix
+except ImportError:
+    resource = None
+
+
+def main():
+
+    args = get_args()
+
+    results = []
+    for post_count in args.posts:
+        user_count = args.users or max(post_count // 25, 10)
+        dataset_directory = os.path.join(args.directory, f'{post_count}_posts')
+        if not os.path.exists(os.path.join(dataset_directory, 'data', 'users.json')):
+            print(f"Generating synthetic dataset with {post_count} posts and {user_count} users...")
+            dataset = so4t_synthetic_data.generate_dataset(user_count, post_count, args.tags,
+                                                           args.skew, seed=args.seed)
+            so4t_synthetic_data.write_dataset(dataset, dataset_directory)
+            del dataset
+
+        for engine in args.engine:
+            print(f"Benchmarking {post_count} posts with the {engine} engine...")
+            # Each benchmark runs in a new process, so the peak memory of one doesn't affect another
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(run_benchmark, dataset_directory, engine, args.workers,
+                                         args.trace_memory).result()
+            result['posts'] = post_count
+            result['users'] = user_count
+            results.append(result)
+            print_result(result)
+
+    results_path = os.path.join(args.directory, 'benchmark_results.json')
+    with open(results_path, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f'Benchmark results saved to: {results_path}')
+
+
+def get_args():
+
+    parser = argparse.ArgumentParser(
+        prog='so4t_benchmark.py',
+        description='Benchmarks each stage of so4t_user_report.py with synthetic data.',
+        epilog='Example: python3 so4t_benchmark.py --posts 10000 100000 --engine python numpy')
+
+    parser.add_argument('--posts',
+                        type=int,
+                        nargs='+',
+                        default=[10000, 100000, 1000000],
+                        help='Total post counts of the datasets to benchmark. '
+                        'Default is 10000 100000 1000000.')
+    parser.add_argument('--users',
+                        type=int,
+                        help='Number of users in each dataset. Default is 1 per 25 posts.')
+    parser.add_argument('--tags',
+                        type=int,
+                        default=200,
+                        help='Number of tags in each dataset. Default is 200.')
+    parser.add_argument('--skew',
+                        type=float,
+                        default=1.0,
+                        help='How unevenly posts are spread across users. See '
+                        'so4t_synthetic_data.py. Default is 1.0.')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=1,
+                        help='Random seed for the synthetic datasets. Default is 1.')
+    parser.add_argument('--engine',
+                        type=str,
+                        nargs='+',
+                        choices=['python', 'numpy'],
+                        default=['python'],
+                        help='Engines to benchmark. Default is python.')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=1,
+                        help='Number of worker processes, the same as the --workers argument of '
+                        'so4t_user_report.py. Default is 1.')
+    parser.add_argument('--trace-memory',
+                        action='store_true',
+                        help='Records the peak memory of each stage with tracemalloc. This is '
+                        'more detailed, but makes every stage considerably slower.')
+    parser.add_argument('--directory',
+                        type=str,
+                        default='benchmark',
+                        help='Directory for the synthetic datasets, reports, and results. '
+                        'Default is benchmark.')
+
+    return parser.parse_args()
+
+
+def run_benchmark(dataset_directory, engine, workers, trace_memory):
+    '''
+    Runs each stage of the report, in the same order as so4t_user_report.main(), and returns the
+    duration (and, if trace_memory is True, the peak traced memory) of each stage
+    '''
+    os.chdir(dataset_directory) # the report reads from and writes to the current directory
+    stages = []
+
+    def run_stage(name, function, *args):
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = function(*args)
+        stage = {'stage': name, 'seconds': round(time.perf_counter() - start, 3)}
+        if trace_memory:
+            stage['peak_memory_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+            tracemalloc.stop()
+        stages.append(stage)
+        return result
+
+    end_date = int(time.time()) + 24*60*60
+    windows = [(0, end_date), (end_date - 366*24*60*60, end_date)]
+
+    # The JSON files are parsed without the sidecar files, so every engine and version of the
+    # script is timed from the same cold start. Loading the sidecar files is timed at the end.
+    api_data = run_stage('load_json', load_api_data, False)
+    gc.freeze() # the same as so4t_user_report.main()
+    if workers > 1:
+        # The workers calculate the metrics of each date range, so the process_users stages below
+        # only copy the metrics to the users
+        users, partition = run_stage('partition_api_data', so4t_user_report.partition_api_data,
+                                     api_data, workers)
+        post_store, timelines = run_stage('process_shards', so4t_user_report.process_shards,
+                                          users, partition, windows, engine)
+        del partition
+    else:
+        users, post_store = run_stage('index_api_data', so4t_user_report.index_api_data, api_data)
+        timelines = run_stage('build_user_timelines', so4t_user_report.build_user_timelines,
+                              users, post_store, engine)
+    del api_data
+
+    run_stage('process_users (all time)', so4t_user_report.process_users,
+              users, *windows[0], timelines)
+    run_stage('process_users (last year)', so4t_user_report.process_users,
+              users, *windows[1], timelines)
+    run_stage('get_answer_latency_summary', so4t_user_report.get_answer_latency_summary,
+              timelines, 0, end_date)
+    run_stage('export_user_metrics (metrics only)', so4t_user_report.export_user_metrics,
+              users, post_store, f'benchmark_{engine}', True)
+    run_stage('create_user_report', so4t_user_report.create_user_report,
+              users, None, None, f'benchmark_{engine}')
+    del users, post_store, timelines
+
+    # Write any sidecar files that are missing or out of date first, so only loading them is timed
+    load_api_data(True)
+    run_stage('load_json (sidecar files)', load_api_data, True)
+    sidecar_stage = stages.pop() # an alternative to load_json, so it's not part of the total
+
+    result = {'engine': engine, 'workers': workers, 'stages': stages,
+              'sidecar_stage': sidecar_stage}
+    if resource:
+        result['peak_rss_mb'] = get_peak_rss_mb(resource.RUSAGE_SELF)
+        if workers > 1:
+            # Each benchmark runs in its own process, so its children are the shard workers.
+            # ru_maxrss of RUSAGE_CHILDREN is the peak of the largest worker, not their sum.
+            result['peak_worker_rss_mb'] = get_peak_rss_mb(resource.RUSAGE_CHILDREN)
+
+    return result
+
+
+def get_peak_rss_mb(who):
+
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+    max_rss = resource.getrusage(who).ru_maxrss
+    if os.uname().sysname == 'Darwin':
+        max_rss = max_rss / 1024
+
+    return round(max_rss / 1024, 1)
+
+
+def load_api_data(use_load_cache):
+
+    api_data = {}
+    for name in ['users', 'reputation_history', 'questions', 'articles', 'tags', 'communities']:
+        api_data[name] = so4t_user_report.read_json(f'{name}.json', use_load_cache)
+
+    return api_data
+
+
+def print_stage(stage):
+
+    line = f"  {stage['stage']:<40} {stage['seconds']:>10.3f}s"
+    if 'peak_memory_mb' in stage:
+        line += f" {stage['peak_memory_mb']:>10.1f} MB"
+    print(line)
+
+
+def print_result(result):
+
+    print(f"\n{result['posts']} posts, {result['users']} users, {result['engine']} engine, "
+          f"{result['workers']} worker(s)")
+    for stage in result['stages']:
+        print_stage(stage)
+    total_seconds = sum(stage['seconds'] for stage in result['stages'])
+    print(f"  {'total':<40} {total_seconds:>10.3f}s")
+    print_stage(result['sidecar_stage'])
+    if 'peak_rss_mb' in result:
+        print(f"  {'peak resident memory':<40} {result['peak_rss_mb']:>10.1f} MB")
+    if 'peak_worker_rss_mb' in result:
+        print(f"  {'peak resident memory (largest worker)':<40} "
+              f"{result['peak_worker_rss_mb']:>10.1f} MB")
+    print()
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,74 @@
+# Standard Python libraries
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+
+class Checkpoint(object):
+    '''
+    Saves the progress of each API crawl as it happens, so a crawl that fails part of the way
+    through can be resumed with --resume instead of starting over.
+
+    Each crawl (an endpoint and its starting parameters) has its own file in the checkpoint
+    directory, to which a record is appended as each page of results arrives. A record holds the
+    items of the page and whatever the API client needs to continue from it, such as the next
+    page number. Records are one JSON object per line, so a record cut off by a crash is simply
+    ignored.
+    '''
+    def __init__(self, directory, resume=False):
+
+        self.directory = directory
+        self.lock = threading.Lock()
+
+        if not resume and os.path.exists(self.directory):
+            shutil.rmtree(self.directory) # start over
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+
+    def get_path(self, endpoint_url, params):
+
+        key = json.dumps([endpoint_url, sorted((params or {}).items())], default=str)
+        file_name = hashlib.sha256(key.encode()).hexdigest() + '.jsonl'
+
+        return os.path.join(self.directory, file_name)
+
+
+    def load(self, endpoint_url, params):
+        '''
+        Returns the records saved for the crawl, in the order they were saved
+        '''
+        records = []
+        try:
+            with open(self.get_path(endpoint_url, params), 'r') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.decoder.JSONDecodeError: # incomplete record
+                        continue
+        except FileNotFoundError:
+            pass
+
+        return records
+
+
+    def save(self, endpoint_url, params, record):
+
+        line = (json.dumps(record) + '\n').encode()
+        with self.lock:
+            with open(self.get_path(endpoint_url, params), 'ab+') as f:
+                # If the last record was cut off, start a new line so the next record is intact
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        line = b'\n' + line
+                f.write(line)
+
+
+    def clear(self):
+        '''
+        Deletes the checkpoint, once all the data it was saving has been exported
+        '''
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,221 @@
+# Third-party libraries
+try:
+    import numpy as np
+except ImportError: # NumPy is only required when using the numpy engine
+    np = None
+
+
+# Fields needed from each type of post (or reputation event) to calculate the user metrics
+POST_FIELDS = {
+    'questions': ['up_vote_count', 'down_vote_count', 'answer_count'],
+    'answers': ['up_vote_count', 'down_vote_count', 'is_accepted'],
+    'articles': ['score'],
+    'comments': [],
+    'reputation_history': ['reputation_change']
+}
+
+
+class UserColumns(object):
+    '''
+    Holds the posts and reputation events of every user, flattened into one table of NumPy arrays
+    per post type. Each table has an 'owner' column (the index of the user in the list of users),
+    a 'creation_date' column, and a column for each field in POST_FIELDS. Rows are ordered by
+    owner, since they're added one user at a time.
+    '''
+    def __init__(self, users, get_user_posts):
+
+        if np is None:
+            print("The numpy engine requires NumPy. Please install it with: pip3 install numpy")
+            raise SystemExit
+
+        self.user_count = len(users)
+        self.tables = {}
+        for post_type, fields in POST_FIELDS.items():
+            posts_by_user = [get_user_posts(user, post_type) for user in users]
+            self.tables[post_type] = self.build_table(posts_by_user, fields)
+        self.tables['answer_latency'] = self.build_latency_table(users, 'answer_response_times')
+        self.tables['first_answer_latency'] = self.build_latency_table(users, 'first_answer_times')
+
+
+    def build_table(self, posts_by_user, fields):
+
+        posts = [post for user_posts in posts_by_user for post in user_posts]
+        table = {
+            'owner': np.repeat(np.arange(len(posts_by_user), dtype=np.int64),
+                               [len(user_posts) for user_posts in posts_by_user]),
+            'creation_date': np.array([post['creation_date'] for post in posts], dtype=np.int64)
+        }
+        for field in fields:
+            table[field] = np.array([post[field] for post in posts], dtype=np.int64)
+
+        return table
+
+
+    def build_latency_table(self, users, field):
+        '''
+        Flattens each user's [creation date, hours] response time pairs, ignoring non-positive
+        response times
+        '''
+        response_times = [[response_time for response_time in user[field] if response_time[1] > 0]
+                          for user in users]
+        table = {
+            'owner': np.repeat(np.arange(len(users), dtype=np.int64),
+                               [len(user_response_times) for user_response_times in response_times]),
+            'creation_date': np.array([response_time[0] for user_response_times in response_times
+                                       for response_time in user_response_times], dtype=np.int64),
+            'hours': np.array([response_time[1] for user_response_times in response_times
+                               for response_time in user_response_times], dtype=np.float64)
+        }
+
+        return table
+
+
+    def get_window_latency(self, table_name, start_date, end_date):
+        '''
+        Returns the response times created after start_date and before end_date, sorted by owner
+        and then by hours, along with the bounds of each owner's response times
+        '''
+        table = self.tables[table_name]
+        in_window = (table['creation_date'] > start_date) & (table['creation_date'] < end_date)
+        owners = table['owner'][in_window]
+        hours = table['hours'][in_window]
+
+        order = np.lexsort((hours, owners))
+        owners, hours = owners[order], hours[order]
+        bounds = np.searchsorted(owners, np.arange(self.user_count + 1))
+
+        return hours, bounds
+
+
+    def get_window_totals(self, post_type, start_date, end_date, metrics):
+        '''
+        Returns the number of rows per user, and the per-user total of each metric, for rows
+        created after start_date and before end_date. Metrics are arrays with one value per row.
+        '''
+        table = self.tables[post_type]
+        in_window = (table['creation_date'] > start_date) & (table['creation_date'] < end_date)
+        owners = table['owner'][in_window]
+
+        # Owners are sorted, so each user's rows are a contiguous range within the window
+        bounds = np.searchsorted(owners, np.arange(self.user_count + 1))
+        totals = {'count': np.diff(bounds)}
+        for metric, values in metrics.items():
+            running_totals = np.concatenate(([0], np.cumsum(values[in_window])))
+            totals[metric] = running_totals[bounds[1:]] - running_totals[bounds[:-1]]
+
+        return totals
+
+
+def get_percentiles(sorted_values, bounds, percentile):
+    '''
+    Returns the percentile of each group of sorted values, using the same linear interpolation
+    as get_percentile in so4t_user_report.py. Groups without values are NaN.
+    '''
+    counts = np.diff(bounds)
+    has_values = counts > 0
+    if not has_values.any():
+        return np.full(len(counts), np.nan)
+
+    position = (counts - 1) * (percentile / 100)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    fraction = position - lower
+
+    last_index = len(sorted_values) - 1
+    lower_values = sorted_values[np.minimum(bounds[:-1] + lower, last_index)]
+    upper_values = sorted_values[np.minimum(bounds[:-1] + upper, last_index)]
+    percentiles = lower_values + (upper_values - lower_values) * fraction
+
+    return np.where(has_values, percentiles, np.nan)
+
+
+def get_latency_metrics(prefix, sorted_hours, bounds):
+    '''
+    Returns a dictionary of per-user percentile lists, rounded to two decimal places. Users
+    without response times get an empty string, the same as the python engine.
+    '''
+    metrics = {}
+    for name, percentile in [('median', 50), ('p90', 90), ('p99', 99)]:
+        values = get_percentiles(sorted_hours, bounds, percentile).tolist()
+        metrics[f'{prefix}_{name}'] = ['' if value != value else round(value, 2)
+                                       for value in values] # NaN is the only value != itself
+
+    return metrics
+
+
+def get_window_latency(columns, start_date, end_date):
+    '''
+    Returns sorted lists of every answer response time and time to first answer created after
+    start_date and before end_date, across all users
+    '''
+    latency = []
+    for table_name in ['answer_latency', 'first_answer_latency']:
+        table = columns.tables[table_name]
+        in_window = (table['creation_date'] > start_date) & (table['creation_date'] < end_date)
+        latency.append(np.sort(table['hours'][in_window]).tolist())
+
+    return latency
+
+
+def build_user_columns(users, get_user_posts):
+    '''
+    get_user_posts(user, post_type) returns the list of a user's posts (or reputation events)
+    '''
+    return UserColumns(users, get_user_posts)
+
+
+def get_window_metrics(columns, start_date, end_date):
+    '''
+    Calculates the user metrics for a date range with vectorized operations. Returns a list of
+    dictionaries, in the same order as the list of users used to build the columns.
+    '''
+    questions = columns.tables['questions']
+    answers = columns.tables['answers']
+    articles = columns.tables['articles']
+    reputation_history = columns.tables['reputation_history']
+
+    question_totals = columns.get_window_totals('questions', start_date, end_date, {
+        'upvotes': questions['up_vote_count'],
+        'downvotes': questions['down_vote_count'],
+        'no_answers': (questions['answer_count'] == 0).astype(np.int64)
+    })
+    answer_totals = columns.get_window_totals('answers', start_date, end_date, {
+        'upvotes': answers['up_vote_count'],
+        'downvotes': answers['down_vote_count'],
+        'accepted': (answers['is_accepted'] != 0).astype(np.int64)
+    })
+    article_totals = columns.get_window_totals('articles', start_date, end_date, {
+        'upvotes': articles['score']
+    })
+    comment_totals = columns.get_window_totals('comments', start_date, end_date, {})
+    reputation_totals = columns.get_window_totals('reputation_history', start_date, end_date, {
+        'reputation_change': reputation_history['reputation_change']
+    })
+
+    metrics = {
+        'question_count': question_totals['count'],
+        'question_upvotes': question_totals['upvotes'],
+        'question_downvotes': question_totals['downvotes'],
+        'questions_with_no_answers': question_totals['no_answers'],
+        'answer_count': answer_totals['count'],
+        'answer_upvotes': answer_totals['upvotes'],
+        'answer_downvotes': answer_totals['downvotes'],
+        'answers_accepted': answer_totals['accepted'],
+        'article_count': article_totals['count'],
+        'article_upvotes': article_totals['upvotes'],
+        'comment_count': comment_totals['count'],
+        'net_reputation': reputation_totals['reputation_change']
+    }
+
+    # Convert to lists of Python integers, so the values are exported the same as the python engine
+    metrics = {metric: values.tolist() for metric, values in metrics.items()}
+    metrics.update(get_latency_metrics(
+        'answer_response_time', *columns.get_window_latency('answer_latency', start_date, end_date)))
+    metrics.update(get_latency_metrics(
+        'first_answer_time',
+        *columns.get_window_latency('first_answer_latency', start_date, end_date)))
+
+    metric_names = list(metrics.keys())
+    metric_values = list(metrics.values())
+
+    return [dict(zip(metric_names, user_values)) for user_values in zip(*metric_values)]
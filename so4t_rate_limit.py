@@ -0,0 +1,266 @@
+# Standard Python libraries
+import contextlib
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl # Unix
+    msvcrt = None
+except ImportError:
+    import msvcrt # Windows
+    fcntl = None
+
+
+class RateLimiter(object):
+    '''
+    Token bucket rate limiter shared by the V2Client and V3Client. Each client calls acquire()
+    before sending a request, and passes the throttling information from each response back to
+    the limiter (update_from_v2 or update_from_v3).
+
+    The request rate adapts to the responses: it increases a little after every successful
+    response, up to max_rate, and is halved whenever the API asks for a backoff or reports a
+    throttle violation. Once the API has pushed back, the rate increases much more slowly near the
+    rate that caused it. This keeps the request rate as close as possible to what the API allows.
+
+    Rate limiting documentation:
+    API v2: https://api.stackexchange.com/docs/throttle
+    API v3: https://api.stackoverflowteams.com/v3 (see the x-burst-throttle and x-token-bucket
+    response headers)
+    '''
+    def __init__(self, rate=10, max_rate=30, min_rate=0.5):
+
+        self.max_rate = max_rate # API v2 allows a maximum of 30 requests per second per IP
+        self.min_rate = min_rate
+        self.rate = min(rate, max_rate)
+        self.tokens = 1
+        self.last_update = self.clock()
+        self.paused_until = 0
+        self.slow_down_rate = max_rate # the last rate at which the API pushed back
+        self.quota_remaining = None
+        self.quota_warning = 100 # warn once when the API v2 quota falls below this
+        self.max_throttle_retries = 5 # times in a row a single request can be throttled
+        self.lock = threading.Lock()
+
+        # Reserve calls in the v3 throttle buckets, so other clients of the API aren't starved
+        self.v3_burst_reserve = 5
+        self.v3_token_bucket_reserve = 100
+
+
+    def clock(self):
+
+        return time.monotonic()
+
+
+    @contextlib.contextmanager
+    def locked(self):
+        '''
+        Holds the lock while the limiter's state is read or changed
+        '''
+        with self.lock:
+            yield
+
+
+    def acquire(self):
+        '''
+        Waits until a request can be sent without exceeding the current rate. Exits if the API v2
+        quota has run out, since every request would be rejected until it resets.
+        '''
+        if self.quota_remaining == 0:
+            print("API quota exhausted. The quota resets daily; run the script again with "
+                  "--resume once it has reset to continue from where it stopped.")
+            raise SystemExit
+
+        with self.locked():
+            now = self.clock()
+            self.refill(now)
+            self.tokens -= 1 # reserve a token; a negative balance is repaid by waiting
+            wait = max(-self.tokens / self.rate, self.paused_until - now, 0)
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+    def refill(self, now):
+
+        # The bucket holds a single token, so requests are evenly spaced rather than sent in bursts
+        self.tokens = min(self.tokens + (now - self.last_update) * self.rate, 1)
+        self.last_update = now
+
+
+    def pause(self, seconds, slow_down=True):
+        '''
+        Stops all requests for the given number of seconds. If slow_down is True, the request
+        rate is also halved, since the API is being called faster than it allows.
+        '''
+        with self.locked():
+            now = self.clock()
+            self.refill(now)
+            self.paused_until = max(self.paused_until, now + seconds)
+            if slow_down:
+                self.slow_down_rate = self.rate
+                self.rate = max(self.rate / 2, self.min_rate)
+
+
+    def speed_up(self):
+
+        with self.locked():
+            increase = 0.5 if self.rate < self.slow_down_rate * 0.9 else 0.05
+            self.rate = min(self.rate + increase, self.max_rate)
+
+
+    def update_from_v2(self, response_json):
+        '''
+        Adjusts the rate based on the 'backoff' field of an API v2 response, and records the
+        'quota_remaining' field. A warning is printed once when the quota runs low, and acquire()
+        stops any further requests once it reaches zero.
+        '''
+        quota_remaining = response_json.get('quota_remaining')
+        if quota_remaining is not None:
+            with self.lock:
+                if (quota_remaining < self.quota_warning and
+                        (self.quota_remaining is None or self.quota_remaining >= self.quota_warning)):
+                    print(f"API quota running low ({quota_remaining} requests remaining).")
+                self.quota_remaining = quota_remaining
+
+        # If the endpoint gets overloaded, it will send a backoff request in the response
+        # Failure to backoff will result in a 502 error (throttle_violation)
+        backoff = response_json.get('backoff')
+        if backoff:
+            print(f"API backoff request received. Waiting {backoff + 1} seconds...")
+            self.pause(backoff + 1)
+            return backoff + 1
+        else:
+            self.speed_up()
+            return 0
+
+
+    def update_from_v3(self, headers):
+        '''
+        Adjusts the rate based on the throttle headers of an API v3 response
+        '''
+        burst_left = headers.get('x-burst-throttle-calls-left')
+        if burst_left is not None and int(burst_left) < self.v3_burst_reserve:
+            burst_wait = int(headers.get('x-burst-throttle-seconds-until-full', 2))
+            print(f"Approaching burst throttle limit ({burst_left} calls left). "
+                  f"Waiting {burst_wait} seconds...")
+            self.pause(burst_wait)
+            return
+
+        bucket_left = headers.get('x-token-bucket-calls-left')
+        if bucket_left is not None and int(bucket_left) < self.v3_token_bucket_reserve:
+            bucket_wait = int(headers.get('x-token-bucket-seconds-until-next-refill', 60))
+            print(f"Token bucket running low ({bucket_left} tokens left). "
+                  f"Waiting {bucket_wait} seconds for refill...")
+            self.pause(bucket_wait, slow_down=False) # waiting for the refill is enough
+            return
+
+        self.speed_up()
+
+
+    def throttle_violation(self, message='', default_wait=30, attempt=1):
+        '''
+        Called when a request was rejected for exceeding the rate limit (v2 throttle_violation or
+        HTTP 429). Pauses requests for as long as the error message asks, if it says, and halves
+        the rate. attempt is the number of times in a row the same request has been throttled;
+        after max_throttle_retries, the script exits rather than retrying forever.
+        '''
+        if attempt > self.max_throttle_retries:
+            print(f"API throttle violation. Reached max retries ({self.max_throttle_retries}).")
+            if message:
+                print(message)
+            raise SystemExit
+
+        match = re.search(r'(\d+) seconds', message or '')
+        wait = int(match.group(1)) + 1 if match else default_wait
+        print(f"API throttle violation. Waiting {wait} seconds before retrying...")
+        self.pause(wait)
+
+
+class SharedRateLimiter(RateLimiter):
+    '''
+    Rate limiter shared by every process on this machine that uses the same API credentials, so
+    concurrent report jobs (e.g. for different --user-id-start and --user-id-end ranges) draw from
+    a single request budget. The limiter's state is kept in a file in the temp directory, and a
+    file lock is held while it's read or changed.
+    '''
+    # Fields of the limiter that are shared with the other processes
+    shared_fields = ['rate', 'tokens', 'last_update', 'paused_until', 'slow_down_rate']
+
+    def __init__(self, credentials, rate=10, max_rate=30, min_rate=0.5, directory=None):
+
+        # The file name is a hash of the credentials, so they're not written to disk
+        key = hashlib.sha256(credentials.encode()).hexdigest()[:16]
+        directory = directory or tempfile.gettempdir()
+        self.state_path = os.path.join(directory, f'so4t_rate_limit_{key}.json')
+        self.lock_path = self.state_path + '.lock'
+
+        super().__init__(rate, max_rate, min_rate)
+
+
+    def clock(self):
+
+        # Wall clock time, since monotonic clocks aren't comparable between processes on every OS
+        return time.time()
+
+
+    @contextlib.contextmanager
+    def locked(self):
+
+        with self.lock, open(self.lock_path, 'a+') as lock_file:
+            lock_exclusive(lock_file)
+            try:
+                self.load_state()
+                yield
+                self.save_state()
+            finally:
+                unlock(lock_file)
+
+
+    def load_state(self):
+
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return # no other process has used the limiter yet
+
+        for field in self.shared_fields:
+            setattr(self, field, state.get(field, getattr(self, field)))
+        self.rate = min(self.rate, self.max_rate)
+
+
+    def save_state(self):
+
+        state = {field: getattr(self, field) for field in self.shared_fields}
+        temp_path = self.state_path + f'.{os.getpid()}'
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+
+def lock_exclusive(lock_file):
+
+    if fcntl:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+    else:
+        lock_file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError: # LK_LOCK gives up after 10 seconds
+                continue
+
+
+def unlock(lock_file):
+
+    if fcntl:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
@@ -1,12 +1,31 @@
-# Third-party libraries
+# Standard Python libraries
 import time
 import socket
 
+# Third-party libraries
+import requests
+from requests.adapters import HTTPAdapter
+
 retry_count = 0
 max_retries = 3
 timeout = 30
 last_api_backoff = 0  # tracks the most recent API-level backoff duration
 
+def create_session(pool_size=10):
+    """
+    Creates a Requests session that keeps connections alive and reuses them between API calls,
+    rather than opening a new connection (and TLS handshake) for every request. pool_size is the
+    maximum number of connections kept open per host. Retries are handled by handle_except, so
+    the adapter does not retry on its own."""
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
 def handle_except(ex):
     name = ex.__class__.__name__
     global timeout
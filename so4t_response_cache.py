@@ -0,0 +1,134 @@
+# Standard Python libraries
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class ResponseCache(object):
+    '''
+    On-disk cache of API responses, used by the V2Client and V3Client for every GET request.
+    Responses are keyed by the method, URL, and parameters (which include the API filter), and
+    each one is saved in its own file in the cache directory.
+
+    Modes:
+    'cache': cached responses younger than ttl seconds are used instead of calling the API
+    'record': the API is always called, and every response is saved
+    'replay': only saved responses are used, regardless of their age, and the API is never called
+
+    When the files in the cache directory exceed max_size bytes, the oldest are deleted.
+    '''
+    def __init__(self, mode='cache', directory='cache', ttl=3600, max_size=1024*1024*1024):
+
+        if mode not in ['cache', 'record', 'replay']:
+            print(f"Unknown response cache mode: {mode}")
+            raise SystemExit
+
+        self.mode = mode
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self.size = sum(os.path.getsize(path) for path in self.get_cache_files())
+
+
+    def get_cache_files(self):
+
+        return [os.path.join(self.directory, file_name) for file_name in os.listdir(self.directory)
+                if file_name.endswith('.json')]
+
+
+    def get_path(self, method, url, params):
+
+        key = json.dumps([method.upper(), url, sorted((params or {}).items())], default=str)
+        file_name = hashlib.sha256(key.encode()).hexdigest() + '.json'
+
+        return os.path.join(self.directory, file_name)
+
+
+    def get(self, method, url, params):
+        '''
+        Returns the cached response for the request, or None if there isn't a usable one. In
+        replay mode, a missing response is an error, since the API can't be called.
+        '''
+        if self.mode == 'record':
+            return None
+
+        path = self.get_path(method, url, params)
+        try:
+            with open(path, 'r') as f:
+                cached = json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            cached = None
+
+        if self.mode == 'replay':
+            if cached is None:
+                print(f"No recorded response for {url} with params {params}")
+                print("Record the responses first with --cache-mode record")
+                raise SystemExit
+        elif cached is None or time.time() - cached['time'] > self.ttl:
+            return None
+
+        return CachedResponse(cached)
+
+
+    def put(self, method, url, params, response):
+
+        if self.mode == 'replay' or response.status_code != 200:
+            return
+
+        cached = {
+            'time': time.time(),
+            'method': method.upper(),
+            'url': url,
+            'params': params,
+            'status_code': response.status_code,
+            'headers': dict(response.headers),
+            'text': response.text
+        }
+        path = self.get_path(method, url, params)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(cached, f, default=str)
+
+        with self.lock:
+            if os.path.exists(path):
+                self.size -= os.path.getsize(path)
+            os.replace(temp_path, path)
+            self.size += os.path.getsize(path)
+            if self.size > self.max_size:
+                self.evict()
+
+
+    def evict(self):
+        '''
+        Deletes the oldest cached responses until the cache is under 90% of its maximum size, so
+        eviction doesn't run again on the next response
+        '''
+        cache_files = sorted(self.get_cache_files(), key=os.path.getmtime)
+        for path in cache_files:
+            if self.size <= self.max_size * 0.9:
+                break
+            self.size -= os.path.getsize(path)
+            os.remove(path)
+
+
+class CachedResponse(object):
+    '''
+    Has the same attributes as a Requests response, for the parts of it the API clients use
+    '''
+    def __init__(self, cached):
+
+        self.status_code = cached['status_code']
+        self.headers = cached['headers']
+        self.text = cached['text']
+        self.url = cached['url']
+
+
+    def json(self):
+
+        return json.loads(self.text)
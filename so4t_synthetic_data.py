@@ -0,0 +1,358 @@
+'''
+Generates a synthetic Stack Internal dataset in the data directory, in the same format as the JSON
+files written by so4t_user_report.py. The dataset can then be used with the --no-api argument, or
+with so4t_benchmark.py, to test the report without a real instance.
+'''
+
+# Standard Python libraries
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+import time
+
+
+# Share of the total post count for each type of post
+POST_TYPE_RATIOS = {
+    'questions': 0.25,
+    'answers': 0.35,
+    'comments': 0.35,
+    'articles': 0.05
+}
+
+
+def main():
+
+    args = get_args()
+    dataset = generate_dataset(args.users, args.posts, args.tags, args.skew,
+                               args.deleted_ratio, args.years, args.seed)
+    write_dataset(dataset, args.directory, args.output_name)
+
+
+def get_args():
+
+    parser = argparse.ArgumentParser(
+        prog='so4t_synthetic_data.py',
+        description='Generates a synthetic dataset for so4t_user_report.py.',
+        epilog='Example: python3 so4t_synthetic_data.py --users 5000 --posts 100000')
+
+    parser.add_argument('--users',
+                        type=int,
+                        default=1000,
+                        help='Number of users. Default is 1000.')
+    parser.add_argument('--posts',
+                        type=int,
+                        default=10000,
+                        help='Total number of questions, answers, comments, and articles. '
+                        'Default is 10000.')
+    parser.add_argument('--tags',
+                        type=int,
+                        default=200,
+                        help='Number of tags. Default is 200.')
+    parser.add_argument('--skew',
+                        type=float,
+                        default=1.0,
+                        help='How unevenly posts are spread across users. Posts are assigned with '
+                        'a Zipf-like distribution, where the user at rank n is weighted '
+                        '1/n^skew. 0 spreads posts evenly. Default is 1.0.')
+    parser.add_argument('--deleted-ratio',
+                        type=float,
+                        default=0.02,
+                        help='Share of posts owned by deleted users. Default is 0.02.')
+    parser.add_argument('--years',
+                        type=int,
+                        default=3,
+                        help='Number of years of activity, ending today. Default is 3.')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=1,
+                        help='Random seed, so the same dataset can be generated again. '
+                        'Default is 1.')
+    parser.add_argument('--directory',
+                        type=str,
+                        default='.',
+                        help='Directory in which to create the data directory. '
+                        'Default is the current directory.')
+    parser.add_argument('--output-name',
+                        type=str,
+                        help='Adds a suffix to the file names, the same as the --output-name '
+                        'argument of so4t_user_report.py.')
+
+    return parser.parse_args()
+
+
+def generate_dataset(user_count, post_count, tag_count=200, skew=1.0, deleted_ratio=0.02,
+                     years=3, seed=1):
+    '''
+    Returns a dictionary with the same keys as the api_data used by so4t_user_report.py: users,
+    reputation_history, questions, articles, tags, and communities.
+    '''
+    rng = random.Random(seed)
+    end_date = int(time.time())
+    start_date = end_date - years*365*24*60*60
+
+    users = generate_users(rng, user_count, start_date, end_date)
+    tags = generate_tags(rng, tag_count, users)
+
+    # Weight users by rank, so a small number of users write most of the posts
+    weights = [1 / (rank ** skew) for rank in range(1, user_count + 1)]
+    rng.shuffle(weights)
+    cumulative_weights = list(itertools.accumulate(weights))
+    deleted_user_ids = list(range(user_count + 2, user_count + 2 + max(user_count // 50, 1)))
+
+    def get_owner():
+        if rng.random() < deleted_ratio:
+            # Deleted users only have a display name, which includes their former user_id
+            return {'display_name': f"user{rng.choice(deleted_user_ids)}",
+                    'user_type': 'does_not_exist'}
+        index = bisect.bisect_left(cumulative_weights, rng.random() * cumulative_weights[-1])
+        user = users[min(index, user_count - 1)]
+        return {
+            'account_id': user['account_id'],
+            'reputation': user['reputation'],
+            'user_id': user['user_id'],
+            'user_type': 'registered',
+            'display_name': user['display_name']
+        }
+
+    counts = {post_type: int(post_count * ratio) for post_type, ratio in POST_TYPE_RATIOS.items()}
+    questions = generate_questions(rng, counts, tags, get_owner, start_date, end_date)
+    articles = generate_articles(rng, counts['articles'], tags, get_owner, start_date, end_date)
+    reputation_history = generate_reputation_history(questions, articles)
+
+    return {
+        'users': users,
+        'reputation_history': reputation_history,
+        'questions': questions,
+        'articles': articles,
+        'tags': tags,
+        'communities': None
+    }
+
+
+def generate_users(rng, user_count, start_date, end_date):
+
+    users = []
+    for user_id in range(2, user_count + 2): # user IDs of 1 and below are excluded by the report
+        creation_date = rng.randint(start_date, end_date)
+        users.append({
+            'user_id': user_id,
+            'account_id': user_id + 1000,
+            'display_name': f"Synthetic User {user_id}",
+            'reputation': 1,
+            'user_type': 'registered',
+            'creation_date': creation_date,
+            'last_access_date': rng.randint(creation_date, end_date),
+            'last_modified_date': rng.randint(creation_date, end_date),
+            'is_deactivated': rng.random() < 0.05,
+            'link': f"https://example.com/users/{user_id}",
+            'email': f"user{user_id}@example.com",
+            'title': rng.choice(['Engineer', 'Senior Engineer', 'Manager', 'Designer', '']),
+            'department': rng.choice(['Engineering', 'Product', 'Support', 'Sales', '']),
+            'external_id': '',
+            'moderator': rng.random() < 0.01
+        })
+
+    return users
+
+
+def generate_tags(rng, tag_count, users):
+
+    tags = []
+    for tag_id in range(1, tag_count + 1):
+        sme_users = rng.sample(users, min(rng.choice([0, 0, 1, 2, 3]), len(users)))
+        sme_groups = []
+        if rng.random() < 0.1:
+            members = rng.sample(users, min(5, len(users)))
+            sme_groups.append({
+                'id': tag_id,
+                'name': f"SME group {tag_id}",
+                'users': [{'id': user['user_id'], 'name': user['display_name']}
+                          for user in members]
+            })
+        tags.append({
+            'id': tag_id,
+            'name': f"tag-{tag_id}",
+            'postCount': 0,
+            'subjectMatterExpertCount': len(sme_users) + len(sme_groups),
+            'watcherCount': rng.randint(0, 50),
+            'smes': {
+                'users': [{'id': user['user_id'], 'name': user['display_name']}
+                          for user in sme_users],
+                'userGroups': sme_groups
+            }
+        })
+
+    return tags
+
+
+def generate_questions(rng, counts, tags, get_owner, start_date, end_date):
+
+    questions = []
+    for question_id in range(1, counts['questions'] + 1):
+        creation_date = rng.randint(start_date, end_date)
+        questions.append({
+            'tags': [tag['name'] for tag in rng.sample(tags, min(3, len(tags)))],
+            'owner': get_owner(),
+            'comment_count': 0,
+            'down_vote_count': int(rng.random() < 0.05),
+            'up_vote_count': rng.choice([0, 0, 1, 1, 2, 3, 5]),
+            'is_answered': False,
+            'view_count': rng.randint(0, 1000),
+            'answer_count': 0,
+            'score': 0,
+            'last_activity_date': creation_date,
+            'creation_date': creation_date,
+            'question_id': question_id,
+            'link': f"https://example.com/questions/{question_id}",
+            'title': f"Synthetic question {question_id}",
+            'answers': [],
+            'comments': []
+        })
+
+    # Spread answers and comments across the questions, with most answers in the first day
+    for answer_id in range(1, counts['answers'] + 1):
+        question = rng.choice(questions)
+        creation_date = min(question['creation_date'] + int(rng.expovariate(1 / 86400)), end_date)
+        question['answers'].append({
+            'owner': get_owner(),
+            'comment_count': 0,
+            'down_vote_count': int(rng.random() < 0.05),
+            'up_vote_count': rng.choice([0, 1, 1, 2, 3, 5, 8]),
+            'is_accepted': False,
+            'score': 0,
+            'last_activity_date': creation_date,
+            'creation_date': creation_date,
+            'answer_id': answer_id,
+            'question_id': question['question_id'],
+            'link': f"https://example.com/a/{answer_id}",
+            'comments': []
+        })
+
+    for comment_id in range(1, counts['comments'] + 1):
+        question = rng.choice(questions)
+        if question['answers'] and rng.random() < 0.5:
+            post = rng.choice(question['answers'])
+            post_id = post['answer_id']
+        else:
+            post = question
+            post_id = question['question_id']
+        creation_date = min(post['creation_date'] + int(rng.expovariate(1 / 3600)), end_date)
+        post['comments'].append({
+            'owner': get_owner(),
+            'edited': False,
+            'score': 0,
+            'creation_date': creation_date,
+            'post_id': post_id,
+            'comment_id': comment_id,
+            'link': f"https://example.com/posts/comments/{comment_id}"
+        })
+
+    for question in questions:
+        question['answer_count'] = len(question['answers'])
+        question['is_answered'] = bool(question['answers'])
+        question['score'] = question['up_vote_count'] - question['down_vote_count']
+        question['comment_count'] = len(question['comments'])
+        if question['answers'] and rng.random() < 0.6:
+            rng.choice(question['answers'])['is_accepted'] = True
+        for answer in question['answers']:
+            answer['score'] = answer['up_vote_count'] - answer['down_vote_count']
+            answer['comment_count'] = len(answer['comments'])
+            if not answer['comments']:
+                del answer['comments'] # the API leaves out empty lists
+        if not question['answers']:
+            del question['answers']
+        if not question['comments']:
+            del question['comments']
+
+    return questions
+
+
+def generate_articles(rng, article_count, tags, get_owner, start_date, end_date):
+
+    articles = []
+    for article_id in range(1, article_count + 1):
+        creation_date = rng.randint(start_date, end_date)
+        articles.append({
+            'tags': [tag['name'] for tag in rng.sample(tags, min(2, len(tags)))],
+            'owner': get_owner(),
+            'comment_count': 0,
+            'view_count': rng.randint(0, 1000),
+            'score': rng.choice([0, 1, 2, 3, 5, 8]),
+            'last_activity_date': creation_date,
+            'creation_date': creation_date,
+            'article_id': article_id,
+            'article_type': rng.choice(['knowledge-article', 'how-to-guide', 'announcement']),
+            'link': f"https://example.com/articles/{article_id}",
+            'title': f"Synthetic article {article_id}"
+        })
+
+    return articles
+
+
+def generate_reputation_history(questions, articles):
+    '''
+    Creates the reputation events that the votes and accepted answers would have generated
+    '''
+    reputation_history = []
+
+    def add_events(post, post_id, upvote_reputation, accepted=False):
+        owner_id = post['owner'].get('user_id')
+        if owner_id is None: # deleted users don't have a reputation history
+            return
+        for _ in range(post.get('up_vote_count', post.get('score', 0))):
+            reputation_history.append({
+                'reputation_history_type': 'post_upvoted',
+                'reputation_change': upvote_reputation,
+                'post_id': post_id,
+                'creation_date': post['creation_date'] + 3600,
+                'user_id': owner_id
+            })
+        for _ in range(post.get('down_vote_count', 0)):
+            reputation_history.append({
+                'reputation_history_type': 'post_downvoted',
+                'reputation_change': -2,
+                'post_id': post_id,
+                'creation_date': post['creation_date'] + 7200,
+                'user_id': owner_id
+            })
+        if accepted:
+            reputation_history.append({
+                'reputation_history_type': 'answer_accepted',
+                'reputation_change': 15,
+                'post_id': post_id,
+                'creation_date': post['creation_date'] + 86400,
+                'user_id': owner_id
+            })
+
+    for question in questions:
+        add_events(question, question['question_id'], 5)
+        for answer in question.get('answers', []):
+            add_events(answer, answer['answer_id'], 10, answer['is_accepted'])
+    for article in articles:
+        add_events(article, article['article_id'], 10)
+
+    return reputation_history
+
+
+def write_dataset(dataset, directory='.', output_name=None):
+
+    data_directory = os.path.join(directory, 'data')
+    if not os.path.exists(data_directory):
+        os.makedirs(data_directory)
+
+    for name, data in dataset.items():
+        if output_name:
+            file_name = f'{name}_{output_name}.json'
+        else:
+            file_name = f'{name}.json'
+        with open(os.path.join(data_directory, file_name), 'w') as f:
+            json.dump(data, f, indent=4)
+        print(f'JSON file created: {file_name}')
+
+
+if __name__ == '__main__':
+
+    main()
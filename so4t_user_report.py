@@ -5,14 +5,25 @@ If you run into difficulties, please leave feedback in the Github Issues.
 
 # Standard Python libraries
 import argparse
+import bisect
+import concurrent.futures
 import csv
+import functools
+import gc
+import itertools
 import json
+import multiprocessing
 import os
 import pickle
+import sys
 import time
-import statistics
 
 # Local libraries
+import so4t_columnar
+import so4t_checkpoint
+import so4t_rate_limit
+import so4t_request_validate
+import so4t_response_cache
 from so4t_web_client import WebClient
 from so4t_api_v2 import V2Client
 from so4t_api_v3 import V3Client
@@ -25,29 +36,59 @@ def main():
 
     if args.no_api:
         print("Skipping API calls and using data from JSON files in the data directory...")
-        api_data = {}
-        api_data['users'] = read_json('users.json')
-        api_data['reputation_history'] = read_json('reputation_history.json')
-        api_data['questions'] = read_json('questions.json')
-        api_data['articles'] = read_json('articles.json')
-        api_data['tags'] = read_json('tags.json')
-        api_data['communities'] = read_json('communities.json')
+        api_data = read_api_data(args.output_name)
         print("Data successfully loaded from JSON files.")
     else:
         api_data = get_api_data(args)
 
-    if args.start_date:
-        start_date = int(time.mktime(time.strptime(args.start_date, '%Y-%m-%d')))
-    else:
-        start_date = 0
+    # The API data is kept until the end of the run, so it's moved out of reach of the garbage
+    # collector. Otherwise, each collection while the data is processed scans all of it again,
+    # and forked worker processes (see process_shards) copy the memory the collector touches.
+    gc.freeze()
 
-    if args.end_date:
-        end_date = int(time.mktime(time.strptime(args.end_date, '%Y-%m-%d')))
+    if args.workers > 1:
+        users, partition = partition_api_data(api_data, args.workers)
+        get_date_range = partition.get_date_range
     else:
-        end_date = 2524626000 # 2050-01-01
+        users, post_store = index_api_data(api_data)
+        get_date_range = functools.partial(get_activity_date_range, users, post_store)
+    del api_data # the nested API data is no longer needed; the posts are held by ID
 
-    users = process_api_data(api_data, start_date, end_date, args.output_name)
-    create_user_report(users, args.start_date, args.end_date, args.output_name)
+    if args.windows or args.period:
+        windows = get_report_windows(args, get_date_range)
+    else:
+        windows = [(args.start_date, args.end_date)]
+
+    if args.workers > 1:
+        # The workers calculate the metrics of every date range, including the whole date range,
+        # for the full user data of a windowed run
+        timestamp_windows = [get_timestamps(window_start, window_end) for window_start, window_end
+                             in windows + [(args.start_date, args.end_date)]]
+        post_store, timelines = process_shards(
+            users, partition, timestamp_windows, args.engine,
+            keep_details=not args.metrics_only or args.export_details,
+            keep_posts=args.export_details)
+        del partition
+    else:
+        timelines = build_user_timelines(users, post_store, args.engine)
+
+    if args.windows or args.period:
+        for window_start, window_end in windows:
+            print(f"Creating user report for {window_start} to {window_end}...")
+            output_name = get_window_output_name(args.output_name, window_start, window_end)
+            create_reports(users, post_store, timelines, window_start, window_end, output_name,
+                           metrics_only=True)
+
+        # Only the metrics change between windows, so each window's JSON file only has the
+        # metrics. The full user data is written once, with the metrics for the whole date range.
+        if not args.metrics_only or args.export_details:
+            start_timestamp, end_timestamp = get_timestamps(args.start_date, args.end_date)
+            users = process_users(users, start_timestamp, end_timestamp, timelines)
+            export_user_metrics(users, post_store, args.output_name, args.metrics_only,
+                                args.export_details)
+    else:
+        create_reports(users, post_store, timelines, args.start_date, args.end_date,
+                       args.output_name, args.metrics_only, args.export_details)
 
 
 def get_args():
@@ -86,6 +127,40 @@ def get_args():
     parser.add_argument('--no-api',
                         action='store_true',
                         help='Skips API calls and uses data from JSON files in the data directory.')
+    parser.add_argument('--windows',
+                        type=str,
+                        help='[OPTIONAL] Path to a file of date ranges to create a report for, '
+                        'one per line in YYYY-MM-DD,YYYY-MM-DD format. The data is loaded and '
+                        'processed once, and a CSV is created for each date range.')
+    parser.add_argument('--period',
+                        action='append',
+                        choices=['monthly', 'quarterly', 'yearly'],
+                        help='[OPTIONAL] Creates a report for each month, quarter, or year '
+                        'between --start-date and --end-date (or across all of the data if '
+                        'they are not specified). Can be used more than once.')
+    parser.add_argument('--engine',
+                        type=str,
+                        choices=['python', 'numpy'],
+                        default='python',
+                        help='[OPTIONAL] Engine used to calculate user metrics. The numpy engine '
+                        'is much faster for large datasets, but requires NumPy to be installed. '
+                        'Default is python.')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=1,
+                        help='[OPTIONAL] Number of worker processes used to process the data. '
+                        'Users are split into this many shards, which are processed in parallel. '
+                        'Default is 1 (no parallel processing).')
+    parser.add_argument('--metrics-only',
+                        action='store_true',
+                        help='[OPTIONAL] Only writes the per-user metrics to the user_metrics '
+                        'JSON file, without the IDs of each post or the reputation history. '
+                        'This is much smaller and faster to write for large datasets.')
+    parser.add_argument('--export-details',
+                        action='store_true',
+                        help='[OPTIONAL] Writes each user, with their posts and reputation '
+                        'history, to a separate user_details JSON file. The file is written one '
+                        'user at a time, so the full export is never held in memory.')
     parser.add_argument('--api-start-date',
                         type=str,
                         help='[OPTIONAL] Start date for API data filtering. '
@@ -108,6 +183,73 @@ def get_args():
                         type=int,
                         help='[OPTIONAL] End user ID for processing. '
                         'Useful for processing users in chunks.')
+    parser.add_argument('--pool-size',
+                        type=int,
+                        default=10,
+                        help='[OPTIONAL] Maximum number of connections kept open to the API. '
+                        'Connections are reused between API calls. Default is 10.')
+    parser.add_argument('--api-workers',
+                        type=int,
+                        default=4,
+                        help='[OPTIONAL] Maximum number of concurrent API calls, for data that is '
+                        'retrieved in batches. Default is 4.')
+    parser.add_argument('--sliced-crawl',
+                        action='store_true',
+                        help='[OPTIONAL] Splits the creation dates of questions and articles into '
+                        'slices of similar size, and gets the slices concurrently (see '
+                        '--api-workers). Recommended for large instances.')
+    parser.add_argument('--keyset-pagination',
+                        action='store_true',
+                        help='[OPTIONAL] Gets users, questions, and articles in order of creation, '
+                        'starting each API call from the creation date of the last item received '
+                        'instead of a page number. Every API call costs the same, however deep '
+                        'into the data it is.')
+    parser.add_argument('--incremental',
+                        action='store_true',
+                        help='[OPTIONAL] Only gets the users, questions, articles, and reputation '
+                        'events that changed since the last run, and merges them into the data '
+                        'saved by that run. If there is no saved data, all data is retrieved.')
+    parser.add_argument('--data-format',
+                        type=str,
+                        choices=['json', 'ndjson'],
+                        default='json',
+                        help='[OPTIONAL] Format of the API data saved in the data directory. '
+                        'ndjson saves one record per line, which --no-api reads one record at a '
+                        'time instead of loading whole files into memory. Default is json.')
+    parser.add_argument('--resume',
+                        action='store_true',
+                        help='[OPTIONAL] Continues from where a previous run that failed during '
+                        'the API calls stopped, using the data it saved to the checkpoint in the '
+                        'data directory. Use the same arguments as the previous run.')
+    parser.add_argument('--cache-mode',
+                        type=str,
+                        choices=['off', 'cache', 'record', 'replay'],
+                        default='off',
+                        help='[OPTIONAL] Caches API responses in the cache directory. "cache" '
+                        'reuses responses younger than --cache-ttl, "record" saves every response, '
+                        'and "replay" only uses saved responses, without calling the API. '
+                        'Default is off.')
+    parser.add_argument('--cache-ttl',
+                        type=int,
+                        default=3600,
+                        help='[OPTIONAL] Number of seconds a cached API response is reused for, '
+                        'when --cache-mode is "cache". Default is 3600.')
+    parser.add_argument('--cache-size',
+                        type=int,
+                        default=1024,
+                        help='[OPTIONAL] Maximum size of the cache directory in MB. The oldest '
+                        'responses are deleted when it is exceeded. Default is 1024.')
+    parser.add_argument('--max-rate',
+                        type=float,
+                        default=30,
+                        help='[OPTIONAL] Maximum number of API calls per second. The request rate '
+                        'adapts to the throttling information returned by the API, up to this '
+                        'maximum. Default is 30.')
+    parser.add_argument('--shared-rate-limit',
+                        action='store_true',
+                        help='[OPTIONAL] Shares the API rate limit with other report jobs running '
+                        'on this machine with the same URL and credentials, so their combined '
+                        'request rate stays within the API limits.')
     parser.add_argument('--output-name',
                         type=str,
                         help='[OPTIONAL] Custom name for output files. '
@@ -145,16 +287,76 @@ def get_api_data(args):
     #             pickle.dump(web_client, f)
         
     # Instantiate V2Client and V3Client classes to make API calls
-    v2client = V2Client(args.url, args.key, args.token)
-    v3client = V3Client(args.url, args.token)
+    # Both clients share a session, so connections (and the SSL verification setting) are reused,
+    # and a rate limiter, so the combined request rate stays within the API's limits
+    session = so4t_request_validate.create_session(max(args.pool_size, args.api_workers))
+    if args.shared_rate_limit:
+        rate_limiter = so4t_rate_limit.SharedRateLimiter(
+            f'{args.url} {args.key} {args.token}', max_rate=args.max_rate)
+    else:
+        rate_limiter = so4t_rate_limit.RateLimiter(max_rate=args.max_rate)
+    response_cache = None
+    if args.cache_mode != 'off':
+        response_cache = so4t_response_cache.ResponseCache(
+            args.cache_mode, ttl=args.cache_ttl, max_size=args.cache_size*1024*1024)
+
+    # Pages are saved to a checkpoint as they arrive, so a failed run can be resumed with --resume
+    if args.output_name:
+        checkpoint_directory = os.path.join('data', f'checkpoint_{args.output_name}')
+    else:
+        checkpoint_directory = os.path.join('data', 'checkpoint')
+    checkpoint = so4t_checkpoint.Checkpoint(checkpoint_directory, resume=args.resume)
+
+    v2client = V2Client(args.url, args.key, args.token, session=session,
+                        rate_limiter=rate_limiter, max_workers=args.api_workers,
+                        response_cache=response_cache, checkpoint=checkpoint)
+    v3client = V3Client(args.url, args.token, session=session, rate_limiter=rate_limiter,
+                        max_workers=args.api_workers, response_cache=response_cache,
+                        checkpoint=checkpoint)
     
-    # Get all questions, answers, comments, articles, tags, and SMEs via API
-    so4t_data = {}
-    so4t_data['users'] = get_users(v2client, v3client, args.max_users, args.user_id_start, args.user_id_end)
-    so4t_data['reputation_history'] = get_reputation_history(v2client, so4t_data['users'])
-    so4t_data['questions'] = get_questions_answers_comments(v2client, api_fromdate, api_todate) # also gets answers/comments
-    so4t_data['articles'] = get_articles(v2client, api_fromdate, api_todate)
-    so4t_data['tags'] = get_tags(v3client) # also gets tag SMEs
+    # With --incremental, only the data that changed since the last run is retrieved, and merged
+    # into the data from the last run
+    sync_state = None
+    if args.incremental:
+        stored_data, sync_state = read_stored_api_data(args.output_name)
+
+    # The time each dataset started being retrieved, saved as the sync state for the next run
+    fetch_starts = {}
+
+    # If the API calls stop with an error (e.g. an expired token), the pages received so far
+    # are kept in the checkpoint, so the run can be continued with --resume
+    try:
+        if sync_state:
+            so4t_data = get_api_data_changes(args, v2client, v3client, checkpoint, stored_data,
+                                             sync_state, fetch_starts, api_fromdate, api_todate)
+        else:
+            # Get all questions, answers, comments, articles, tags, and SMEs via API
+            so4t_data = {}
+            fetch_starts['users'] = get_fetch_start(checkpoint, 'users')
+            so4t_data['users'] = get_users(v2client, v3client, args.max_users, args.user_id_start, args.user_id_end,
+                                           args.keyset_pagination)
+            fetch_starts['reputation_history'] = get_fetch_start(checkpoint, 'reputation_history')
+            so4t_data['reputation_history'] = get_reputation_history(v2client, so4t_data['users'])
+            fetch_starts['questions'] = get_fetch_start(checkpoint, 'questions')
+            so4t_data['questions'] = get_questions_answers_comments(v2client, api_fromdate, api_todate,
+                                                                    args.sliced_crawl, args.keyset_pagination) # also gets answers/comments
+            fetch_starts['articles'] = get_fetch_start(checkpoint, 'articles')
+            so4t_data['articles'] = get_articles(v2client, api_fromdate, api_todate, args.sliced_crawl,
+                                                 args.keyset_pagination)
+            so4t_data['tags'] = get_tags(v3client) # also gets tag SMEs
+    except SystemExit:
+        print("The data retrieved so far has been saved to the checkpoint. Once the cause of "
+              "the error has been fixed, run the script again with --resume to continue "
+              "from where it stopped.")
+        raise SystemExit(1)
+
+    # A failed API v2 call ends its crawl early. The incomplete data isn't exported, and the high-
+    # water marks aren't advanced, since the next --incremental run wouldn't get the missing data.
+    if v2client.failed:
+        print("Some API calls failed, so the data retrieved is incomplete and hasn't been saved. "
+              "Once the cause of the failure has been fixed, run the script again with --resume "
+              "to continue from where it stopped.")
+        raise SystemExit(1)
 
     # Get additional data via web scraping
     # if args.web_client:
@@ -162,17 +364,174 @@ def get_api_data(args):
     # else:
     #     so4t_data['communities'] = None
 
-    # Export API data to JSON file
+    # Export API data to JSON or NDJSON files
     for name, data in so4t_data.items():
-        if args.output_name:
-            export_to_json(f'{name}_{args.output_name}', data)
+        data_name = f'{name}_{args.output_name}' if args.output_name else name
+        if args.data_format == 'ndjson':
+            export_to_ndjson(data_name, data)
         else:
-            export_to_json(name, data)
+            export_to_json(data_name, data)
+
+    # Save the high-water marks of the data, so the next run with --incremental knows what changed
+    if args.output_name:
+        export_to_json(f'sync_state_{args.output_name}', fetch_starts)
+    else:
+        export_to_json('sync_state', fetch_starts)
+
+    checkpoint.clear() # all the data has been exported, so the run doesn't need to be resumed
 
     return so4t_data
 
 
-def get_users(v2client, v3client, max_users=None, user_id_start=None, user_id_end=None):
+def read_stored_api_data(output_name=None):
+    """
+    Returns the API data and sync state saved by the last run, or None for the sync state if
+    any of the files are missing"""
+
+    stored_data = {}
+    suffix = f'_{output_name}' if output_name else ''
+    try:
+        sync_state = read_json(f'sync_state{suffix}.json')
+        for name in ['users', 'reputation_history', 'questions', 'articles']:
+            stored_data[name] = list(read_dataset(f'{name}{suffix}'))
+    except FileNotFoundError:
+        print("Data from a previous run not found. Getting all data from the API...")
+        return None, None
+
+    return stored_data, sync_state
+
+
+def read_api_data(output_name=None):
+    """
+    Returns the API data saved in the data directory. With an output name, the files saved with
+    that suffix are used, falling back to the files without a suffix if there aren't any.
+
+    Datasets saved as NDJSON are returned as iterators that read one record at a time, so
+    the posts and reputation events are streamed into index_api_data rather than loaded at once.
+    Users are modified while the posts are attributed, so they're always loaded into a list."""
+
+    api_data = {}
+    for name in ['users', 'reputation_history', 'questions', 'articles', 'tags', 'communities']:
+        data_name = name
+        if output_name and any(os.path.exists(os.path.join('data', f'{name}_{output_name}{ext}'))
+                               for ext in ['.json', '.ndjson']):
+            data_name = f'{name}_{output_name}'
+        api_data[name] = read_dataset(data_name)
+    api_data['users'] = list(api_data['users'])
+
+    return api_data
+
+
+# Seconds subtracted from each high-water mark, to allow for clock differences with the API
+sync_overlap = 10*60
+
+
+def get_fetch_start(checkpoint, name):
+    """
+    Returns the time the retrieval of a dataset started, taken before its first API call, to be
+    saved as the dataset's high-water mark. Anything that changes while the dataset is being
+    retrieved is then retrieved again by the next --incremental run, rather than missed.
+    The time is saved in the checkpoint, so a resumed run keeps the time of the run that
+    retrieved the first pages."""
+
+    records = checkpoint.load('fetch_start', {'dataset': name})
+    if records:
+        return records[0]['time']
+
+    fetch_start = int(time.time())
+    checkpoint.save('fetch_start', {'dataset': name}, {'time': fetch_start})
+
+    return fetch_start
+
+
+def get_sync_dates(sync_state):
+    """
+    Returns the date from which to get each dataset's changes: the time the last run started
+    retrieving it, less sync_overlap to allow for differences between this machine's clock and
+    the API's. Items changed within the overlap are retrieved twice, and merged by ID."""
+
+    return {name: max(fetch_start - sync_overlap, 0) for name, fetch_start in sync_state.items()}
+
+
+def get_api_data_changes(args, v2client, v3client, checkpoint, stored_data, sync_state,
+                         fetch_starts, fromdate=None, todate=None):
+    """
+    Gets the users, questions, and articles that changed since the high-water marks in
+    sync_state, and the new reputation events, and merges them into the stored data. Tags are
+    always retrieved in full, since their SMEs don't have a modification date. The time each
+    dataset started being retrieved is added to fetch_starts."""
+
+    print("Getting data that changed since the last run...")
+    sync_dates = get_sync_dates(sync_state)
+    so4t_data = {}
+    fetch_starts['users'] = get_fetch_start(checkpoint, 'users')
+    changed_users = get_users(v2client, v3client, args.max_users, args.user_id_start,
+                              args.user_id_end, modified_since=sync_dates['users'])
+    so4t_data['users'] = merge_by_id(stored_data['users'], changed_users, 'user_id')
+    if args.max_users is not None:
+        so4t_data['users'] = get_top_users(so4t_data['users'], args.max_users)
+
+    fetch_starts['reputation_history'] = get_fetch_start(checkpoint, 'reputation_history')
+    new_events = get_reputation_history(v2client, so4t_data['users'],
+                                        since=sync_dates['reputation_history'])
+    so4t_data['reputation_history'] = merge_reputation_history(
+        stored_data['reputation_history'], new_events, sync_dates['reputation_history'],
+        so4t_data['users'])
+
+    fetch_starts['questions'] = get_fetch_start(checkpoint, 'questions')
+    changed_questions = get_questions_answers_comments(
+        v2client, fromdate, todate, activity_since=sync_dates['questions'])
+    so4t_data['questions'] = merge_by_id(stored_data['questions'], changed_questions,
+                                         'question_id')
+    fetch_starts['articles'] = get_fetch_start(checkpoint, 'articles')
+    changed_articles = get_articles(v2client, fromdate, todate,
+                                    activity_since=sync_dates['articles'])
+    so4t_data['articles'] = merge_by_id(stored_data['articles'], changed_articles, 'article_id')
+
+    so4t_data['tags'] = get_tags(v3client) # also gets tag SMEs
+
+    new_event_count = len(so4t_data['reputation_history']) - len(stored_data['reputation_history'])
+    print(f"Merged {len(changed_users)} changed users, {new_event_count} new reputation events, "
+          f"{len(changed_questions)} changed questions, and {len(changed_articles)} changed "
+          "articles into the data from the last run.")
+
+    return so4t_data
+
+
+def merge_by_id(stored_items, changed_items, id_field):
+    """
+    Replaces stored items with the changed items that have the same ID, and adds the rest of the
+    changed items at the end"""
+
+    merged_items = {item[id_field]: item for item in stored_items}
+    for item in changed_items:
+        merged_items[item[id_field]] = item
+
+    return list(merged_items.values())
+
+
+def merge_reputation_history(stored_events, new_events, since, users):
+    """
+    Reputation events don't have an ID. The events of each user are retrieved from the 'since'
+    date onward, so they replace the stored events of those users from that date."""
+
+    user_ids = {user['user_id'] for user in users}
+    stored_events = [event for event in stored_events
+                     if event['creation_date'] < since or event['user_id'] not in user_ids]
+
+    return stored_events + new_events
+
+
+def get_top_users(users, max_users):
+    """
+    Returns the max_users users with the highest reputation. Users with the same reputation keep
+    their order."""
+
+    return sorted(users, key=lambda user: -user.get('reputation', 0))[:max_users]
+
+
+def get_users(v2client, v3client, max_users=None, user_id_start=None, user_id_end=None,
+              keyset=False, modified_since=None):
 
     # Filter documentation: https://api.stackexchange.com/docs/filters
     if 'soedemo' in v2client.api_url: # for internal testing
@@ -185,7 +544,32 @@ def get_users(v2client, v3client, max_users=None, user_id_start=None, user_id_en
     else: # Stack Internal (Business) or Basic
         filter_string = ''
 
-    v2_users = v2client.get_all_users(filter_string)
+    # Rather than getting every user, only get the users in the ID range (if getting them by ID
+    # takes fewer API calls), or stop once the max_users users with the highest reputation have
+    # been received. Users are listed by reputation for this, rather than with keyset pagination,
+    # which lists them in order of creation.
+    min_user_id = max(user_id_start or 2, 2) # user IDs of 1 and below are excluded below
+    if user_id_end is not None and \
+            user_id_end - min_user_id < v2client.get_user_count():
+        v2_users = v2client.get_users_by_ids(range(min_user_id, user_id_end + 1), filter_string,
+                                             modified_since)
+    else:
+        stop_when = None
+        if max_users is not None:
+            max_user_id = user_id_end if user_id_end is not None else float('inf')
+            users_in_range = 0
+            users_checked = 0
+
+            # Keep a running count, since stop_when is called with every user received so far
+            def stop_when(users):
+                nonlocal users_in_range, users_checked
+                users_in_range += sum(min_user_id <= user['user_id'] <= max_user_id
+                                      for user in users[users_checked:])
+                users_checked = len(users)
+                return users_in_range >= max_users
+
+        v2_users = v2client.get_all_users(filter_string, keyset=keyset and max_users is None,
+                                          stop_when=stop_when, modified_since=modified_since)
 
     # Exclude users with an ID of less than 1 (i.e. Community user and user groups)
     v2_users = [user for user in v2_users if user['user_id'] > 1]
@@ -196,9 +580,9 @@ def get_users(v2client, v3client, max_users=None, user_id_start=None, user_id_en
     if user_id_end is not None:
         v2_users = [user for user in v2_users if user['user_id'] <= user_id_end]
 
-    # Apply max users limit if specified
+    # Apply max users limit if specified, keeping the users with the highest reputation
     if max_users is not None:
-        v2_users = v2_users[:max_users]
+        v2_users = get_top_users(v2_users, max_users)
         print(f"Limited to {max_users} users for processing")
 
     if 'soedemo' in v3client.api_url: # for internal testing only
@@ -206,10 +590,21 @@ def get_users(v2client, v3client, max_users=None, user_id_start=None, user_id_en
 
     print(f"Processing {len(v2_users)} users...")
 
-    v3_users = v3client.get_all_users()
-    
     # Add additional user data from API v3 to user data from API v2
     # API v3 fields to add: 'email', 'jobTitle', 'department', 'externalId, 'role'
+
+    # For a subset of users, getting each user from API v3 can take fewer API calls than getting
+    # every user. This is only done for Stack Internal (Enterprise), where API v2 says which users
+    # are deactivated. Otherwise, deactivated users are identified by being missing from the
+    # API v3 user list.
+    is_subset = max_users is not None or user_id_start is not None or user_id_end is not None \
+        or modified_since is not None
+    if is_subset and v2client.soe and len(v2_users) < v3client.get_user_count() / 100:
+        print("Getting API v3 data for each user...")
+        get_v3_user_fields(v3client, v2_users)
+        return v2_users
+
+    v3_users = v3client.get_all_users()
     
     # Create a lookup dictionary for v3 users for faster matching
     v3_users_lookup = {v3_user['id']: v3_user for v3_user in v3_users}
@@ -221,59 +616,57 @@ def get_users(v2client, v3client, max_users=None, user_id_start=None, user_id_en
         v3_user = v3_users_lookup.get(user['user_id'])
         if v3_user:
             # User found in v3 data
-            user['email'] = safe_get_user_field(v3_user, 'email', '')
-            user['title'] = safe_get_user_field(v3_user, 'jobTitle', '')
-            user['department'] = safe_get_user_field(v3_user, 'department', '')
-            user['external_id'] = safe_get_user_field(v3_user, 'externalId', '')
-            user['moderator'] = (safe_get_user_field(v3_user, 'role', '') == 'Moderator')
+            add_v3_user_fields(user, v3_user)
         else:
             # User not found in v3 data - likely deactivated
             deactivated_users.append(user)
     
-    # Process deactivated users in batches to reduce API calls
     if deactivated_users:
-        print(f"Found {len(deactivated_users)} deactivated users, processing in batches...")
-        batch_size = 10  # Process 10 deactivated users at a time
-        
-        for i in range(0, len(deactivated_users), batch_size):
-            batch = deactivated_users[i:i + batch_size]
-            print(f"Processing deactivated users batch {i//batch_size + 1}/{(len(deactivated_users) + batch_size - 1)//batch_size}")
-            
-            for user in batch:
-                try:
-                    v3_user = v3client.get_user(user['user_id'])
-                    user['email'] = safe_get_user_field(v3_user, 'email', '')
-                    user['title'] = safe_get_user_field(v3_user, 'jobTitle', '')
-                    user['department'] = safe_get_user_field(v3_user, 'department', '')
-                    user['external_id'] = safe_get_user_field(v3_user, 'externalId', '')
-                    user['is_deactivated'] = True
-                    user['moderator'] = (safe_get_user_field(v3_user, 'role', '') == 'Moderator')
-                except Exception as e:
-                    print(f"Failed to get data for deactivated user {user['user_id']}: {e}")
-                    # Set default values for failed users
-                    user['email'] = ''
-                    user['title'] = ''
-                    user['department'] = ''
-                    user['external_id'] = ''
-                    user['is_deactivated'] = True
-                    user['moderator'] = False
-            
-            # Add delay between batches to avoid rate limiting
-            if i + batch_size < len(deactivated_users):
-                time.sleep(1)  # 1 second delay between batches
+        print(f"Found {len(deactivated_users)} deactivated users, getting their details...")
+        get_v3_user_fields(v3client, deactivated_users, deactivated=True)
 
     return v2_users
 
 
-def get_reputation_history(v2client, users):
+def add_v3_user_fields(user, v3_user):
+
+    user['email'] = safe_get_user_field(v3_user, 'email', '')
+    user['title'] = safe_get_user_field(v3_user, 'jobTitle', '')
+    user['department'] = safe_get_user_field(v3_user, 'department', '')
+    user['external_id'] = safe_get_user_field(v3_user, 'externalId', '')
+    user['moderator'] = (safe_get_user_field(v3_user, 'role', '') == 'Moderator')
+
+
+def get_v3_user_fields(v3client, users, deactivated=False):
+    """
+    Gets each user from API v3 individually, and adds the API v3 fields to the user. API v2 can
+    get users in batches, but doesn't have the API v3 fields, so the users are retrieved
+    concurrently instead, with every API call paced by the rate limiter."""
+
+    def get_user_fields(user):
+        try:
+            v3_user = v3client.get_user(user['user_id'])
+        except Exception as e:
+            print(f"Failed to get data for user {user['user_id']}: {e}")
+            v3_user = {} # default values for failed users
+        add_v3_user_fields(user, v3_user)
+        if deactivated:
+            user['is_deactivated'] = True
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=v3client.max_workers) as executor:
+        list(executor.map(get_user_fields, users))
+
+
+def get_reputation_history(v2client, users, since=None):
 
     user_ids = [user['user_id'] for user in users]
-    reputation_history = v2client.get_reputation_history(user_ids)
+    reputation_history = v2client.get_reputation_history(user_ids, since=since)
 
     return reputation_history
 
 
-def get_questions_answers_comments(v2client, fromdate=None, todate=None):
+def get_questions_answers_comments(v2client, fromdate=None, todate=None, sliced=False,
+                                   keyset=False, activity_since=None):
     
     # The API filter used for the /questions endpoint makes it so that the API returns
     # all answers and comments for each question. This is more efficient than making
@@ -308,12 +701,15 @@ def get_questions_answers_comments(v2client, fromdate=None, todate=None):
         filter_string = v2client.create_filter(filter_attributes)
     else: # Stack Internal (Business) or Basic
         filter_string = '!X9DEEiFwy0OeSWoJzb.QMqab2wPSk.X2opZDa2L'
-    questions = v2client.get_all_questions(filter_string, fromdate=fromdate, todate=todate)
+    questions = v2client.get_all_questions(filter_string, fromdate=fromdate, todate=todate,
+                                           sliced=sliced, keyset=keyset,
+                                           activity_since=activity_since)
 
     return questions
 
 
-def get_articles(v2client, fromdate=None, todate=None):
+def get_articles(v2client, fromdate=None, todate=None, sliced=False, keyset=False,
+                 activity_since=None):
 
     # Filter documentation: https://api.stackexchange.com/docs/filters
     if v2client.soe:
@@ -331,7 +727,9 @@ def get_articles(v2client, fromdate=None, todate=None):
     else: # Stack Internal (Business) or Basic
         filter_string = '!*Mg4Pjg9LXr9d_(v'
 
-    articles = v2client.get_all_articles(filter_string, fromdate=fromdate, todate=todate)
+    articles = v2client.get_all_articles(filter_string, fromdate=fromdate, todate=todate,
+                                         sliced=sliced, keyset=keyset,
+                                         activity_since=activity_since)
 
     return articles
 
@@ -343,28 +741,23 @@ def get_tags(v3client):
     tags = v3client.get_all_tags()
 
     # Get subject matter experts (SMEs) for each tag. This API call is only available in v3.
-    # Process tags with SMEs in batches to reduce API calls
+    # Tags are processed concurrently; every API call still waits for the shared rate limiter,
+    # which adapts to the v3 throttle headers
     tags_with_smes = [tag for tag in tags if tag['subjectMatterExpertCount'] > 0]
-    
+
+    def get_smes(tag):
+        try:
+            tag['smes'] = v3client.get_tag_smes(tag['id'])
+        except Exception as e:
+            print(f"Failed to get SMEs for tag {tag['id']}: {e}")
+            tag['smes'] = {'users': [], 'userGroups': []}
+
     if tags_with_smes:
-        print(f"Found {len(tags_with_smes)} tags with SMEs, processing in batches...")
-        batch_size = 5  # Process 5 tags at a time
-        
-        for i in range(0, len(tags_with_smes), batch_size):
-            batch = tags_with_smes[i:i + batch_size]
-            print(f"Processing tag SMEs batch {i//batch_size + 1}/{(len(tags_with_smes) + batch_size - 1)//batch_size}")
-            
-            for tag in batch:
-                try:
-                    tag['smes'] = v3client.get_tag_smes(tag['id'])
-                except Exception as e:
-                    print(f"Failed to get SMEs for tag {tag['id']}: {e}")
-                    tag['smes'] = {'users': [], 'userGroups': []}
-            
-            # Add delay between batches to avoid rate limiting
-            if i + batch_size < len(tags_with_smes):
-                time.sleep(0.5)  # 500ms delay between batches
-    
+        print(f"Found {len(tags_with_smes)} tags with SMEs, getting SMEs for each tag...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=v3client.max_workers) as executor:
+            list(executor.map(get_smes, tags_with_smes))
+        get_sme_group_members(v3client, tags_with_smes)
+
     # Set empty SMEs for tags without SMEs
     for tag in tags:
         if tag['subjectMatterExpertCount'] == 0:
@@ -373,48 +766,481 @@ def get_tags(v3client):
     return tags
 
 
-def process_api_data(api_data, start_date, end_date, output_name=None):
+def get_sme_group_members(v3client, tags):
+    '''
+    SME user groups normally list their members. The members of any group that doesn't are
+    retrieved from the group itself (once per group), so they're still counted as SMEs.
+    '''
+    groups = {}
+    for tag in tags:
+        for group in tag['smes']['userGroups']:
+            if 'users' not in group:
+                groups.setdefault(group['id'], []).append(group)
+    if not groups:
+        return
+
+    def get_members(group_id):
+        try:
+            return v3client.get_user_group(group_id)['users']
+        except Exception as e:
+            print(f"Failed to get the members of user group {group_id}: {e}")
+            return None
+
+    print(f"Getting the members of {len(groups)} SME user groups...")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=v3client.max_workers) as executor:
+        for group_id, members in zip(groups, executor.map(get_members, groups)):
+            if members is not None:
+                for group in groups[group_id]:
+                    group['users'] = members
+
+
+def get_report_windows(args, get_date_range):
+    """
+    Returns a list of (start date, end date) tuples, in YYYY-MM-DD format, from the file passed
+    to --windows and the periods passed to --period. End dates are exclusive. get_date_range()
+    returns the timestamps of the first and last activity, and is only called if needed."""
+
+    windows = []
+    if args.windows:
+        with open(args.windows, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                window_start, window_end = [date.strip() for date in line.split(',')]
+                windows.append((window_start, window_end))
+
+    if args.period:
+        if args.start_date and args.end_date:
+            range_start, range_end = args.start_date, args.end_date
+        else:
+            first_date, last_date = get_date_range()
+            range_start = args.start_date or time.strftime('%Y-%m-%d', time.localtime(first_date))
+            range_end = args.end_date or time.strftime('%Y-%m-%d',
+                                                       time.localtime(last_date + 24*60*60))
+        for period in args.period:
+            windows += get_period_windows(period, range_start, range_end)
+
+    return windows
+
+
+def get_period_windows(period, range_start, range_end):
+    """
+    Splits a date range into calendar months, quarters, or years. The first window starts at the
+    beginning of the period that contains range_start."""
+
+    months_per_period = {'monthly': 1, 'quarterly': 3, 'yearly': 12}[period]
+    year, month = [int(part) for part in range_start.split('-')[:2]]
+    month -= (month - 1) % months_per_period # align to the start of the period
+
+    windows = []
+    window_start = f'{year:04d}-{month:02d}-01'
+    while window_start < range_end:
+        month += months_per_period
+        if month > 12:
+            year, month = year + 1, month - 12
+        window_end = f'{year:04d}-{month:02d}-01'
+        windows.append((window_start, window_end))
+        window_start = window_end
+
+    return windows
+
+
+def get_activity_date_range(users, post_store):
+
+    dates = [event['creation_date'] for user in users for event in user['reputation_history']]
+    for posts in post_store.values():
+        dates += [post['creation_date'] for post in posts.values()]
+
+    if not dates:
+        return time.time(), time.time()
+
+    return min(dates), max(dates)
+
+
+def get_window_output_name(output_name, window_start, window_end):
+
+    if output_name:
+        return f'{output_name}_{window_start}_to_{window_end}'
+    return f'{window_start}_to_{window_end}'
+
+
+def create_reports(users, post_store, timelines, start_date, end_date, output_name,
+                   metrics_only=False, export_details=False):
+    """
+    Calculates the user metrics for a date range and exports them to JSON and CSV, along with a
+    CSV of the instance-wide answer latency. Dates are in YYYY-MM-DD format, or None."""
+
+    start_timestamp, end_timestamp = get_timestamps(start_date, end_date)
+    users = process_users(users, start_timestamp, end_timestamp, timelines)
+    export_user_metrics(users, post_store, output_name, metrics_only, export_details)
+
+    create_user_report(users, start_date, end_date, output_name)
+    latency = get_answer_latency_summary(timelines, start_timestamp, end_timestamp)
+    create_answer_latency_report(latency, start_date, end_date, output_name)
+
+
+def get_timestamps(start_date, end_date):
+    """
+    Converts the dates of a date range, in YYYY-MM-DD format or None, to timestamps. Without a
+    start or end date, the range is open on that end."""
+
+    if start_date:
+        start_timestamp = date_to_timestamp(start_date)
+    else:
+        start_timestamp = 0
+
+    if end_date:
+        end_timestamp = date_to_timestamp(end_date)
+    else:
+        end_timestamp = 2524626000 # 2050-01-01
+
+    return start_timestamp, end_timestamp
+
+
+def export_user_metrics(users, post_store, output_name, metrics_only=False,
+                        export_details=False):
+
+    if output_name:
+        data_name = f'user_metrics_{output_name}'
+    else:
+        data_name = 'user_metrics'
+
+    if metrics_only:
+        export_to_json(data_name, [get_user_metrics(user) for user in users], indent=None)
+    else:
+        export_to_json(data_name, users)
+
+    if export_details:
+        details_name = data_name.replace('user_metrics', 'user_details', 1)
+        export_to_json_stream(details_name,
+                              (get_user_details(user, post_store) for user in users))
+
 
+def get_user_metrics(user):
+    """
+    Returns the user without the detail fields (post IDs, reputation history, and response
+    times); i.e. the user's profile and aggregated metrics"""
+
+    return {field: value for field, value in user.items() if field not in USER_DETAIL_FIELDS}
+
+
+def get_user_details(user, post_store):
+    """
+    Returns a copy of the user with their posts looked up in the post store"""
+
+    user_details = dict(user)
+    for post_type in POST_ID_FIELDS:
+        user_details[post_type] = get_user_posts(user, post_store, post_type)
+
+    return user_details
+
+
+def index_api_data(api_data):
+    """
+    Attributes tags, posts, and reputation events to each user. This only needs to be done once,
+    regardless of how many date ranges are reported on.
+
+    Returns the list of users and a post store. The post store has a table of questions, answers,
+    comments, and articles, each keyed by post ID. Users only hold the IDs of their posts."""
+
+    post_store = initialize_post_store()
     users = api_data['users']
     users = add_new_user_fields(users)
+    user_lookup = build_user_lookup(users)
     users = process_tags(users, api_data['tags'])
-    users = process_questions(users, api_data['questions'])
-    users = process_articles(users, api_data['articles'])
-    users = process_reputation_history(users, api_data['reputation_history'])
-    users = process_users(users, start_date, end_date)
+    attribute = functools.partial(attribute_post, post_store)
+    users = process_questions(users, api_data['questions'], user_lookup, attribute)
+    users = process_articles(users, api_data['articles'], user_lookup, attribute)
+    reputation_by_user = group_reputation_history(api_data['reputation_history'])
+    users = process_reputation_history(users, reputation_by_user)
 
-    # tags = process_communities(tags, api_data.get('communities'))
+    return users, post_store
 
-    if output_name:
-        export_to_json(f'user_metrics_{output_name}', users)
+
+def partition_api_data(api_data, workers):
+    """
+    Prepares the API data to be processed by process_shards, in a pool of worker processes.
+
+    Tags are added to the users, and deleted users are created, in the same order as
+    index_api_data. Each post and reputation event is then assigned, without being copied, to the
+    shard of its owner. Returns the list of users and the ShardPartition."""
+
+    users = api_data['users']
+    users = add_new_user_fields(users)
+    user_lookup = build_user_lookup(users)
+    users = process_tags(users, api_data['tags'])
+
+    partition = ShardPartition(users, workers)
+    users = process_questions(users, api_data['questions'], user_lookup, partition.add)
+    users = process_articles(users, api_data['articles'], user_lookup, partition.add)
+    partition.reputation_by_user = group_reputation_history(api_data['reputation_history'])
+
+    return users, partition
+
+
+def process_shards(users, partition, windows, engine='python', keep_details=False,
+                   keep_posts=False):
+    """
+    Processes the shards of a partition in parallel. Each worker process attributes the posts and
+    reputation events of a shard to its users, builds their timelines, and calculates their
+    metrics for each date range in windows (pairs of timestamps). Only the metrics are sent back,
+    and the results are identical to index_api_data, build_user_timelines, and process_users.
+
+    Returns a post store and a ShardResults, which process_users and get_answer_latency_summary
+    use in place of the timelines. With keep_details, the post IDs and reputation history of each
+    user are added to the users, for the full user data export. With keep_posts, the post store
+    has every post, for --export-details; otherwise it's empty."""
+
+    shards = partition.get_shards(windows, engine, keep_details, keep_posts)
+    print(f"Processing {len(users)} users in {len(shards)} shards...")
+
+    # Forked worker processes inherit the shards, so the posts don't need to be pickled and sent
+    # to them. Where processes can't be forked (safely), each shard is sent to its worker instead.
+    if 'fork' in multiprocessing.get_all_start_methods() and sys.platform != 'darwin':
+        mp_context = multiprocessing.get_context('fork')
+        inherited_shards[:] = shards
+        tasks = range(len(shards))
     else:
-        export_to_json('user_metrics', users)
-    
-    return users
+        mp_context = None
+        tasks = shards
+
+    post_store = initialize_post_store()
+    results = ShardResults(len(users), windows)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=len(shards),
+                                                    mp_context=mp_context) as executor:
+            for positions, shard_windows, user_posts, shard_store in executor.map(
+                    process_shard, tasks):
+                results.add_shard(positions, shard_windows)
+                if keep_details:
+                    for position, posts in zip(positions, user_posts):
+                        users[position].update(posts)
+                if keep_posts:
+                    for post_type, posts in shard_store.items():
+                        post_store[post_type].update(posts)
+    finally:
+        inherited_shards.clear()
+
+    if keep_details:
+        users = process_reputation_history(users, partition.reputation_by_user)
+
+    return post_store, results
+
+
+# Shards of the current process_shards call, inherited by forked worker processes
+inherited_shards = []
+
+
+class ShardPartition(object):
+    '''
+    Assigns each user to one of shard_count shards, based on their position in the list of users,
+    and collects the posts of each shard. add() has the same signature as attribute_post, so it
+    can be passed to process_questions and process_articles.
+    '''
+    def __init__(self, users, shard_count):
+
+        self.users = users
+        self.shard_count = shard_count
+        self.positions = {}
+        self.items = [[] for _ in range(shard_count)]
+        self.reputation_by_user = {}
+
+
+    def get_position(self, user):
+
+        # Deleted users are added to the end of the list of users while posts are attributed
+        if id(user) not in self.positions:
+            for position in range(len(self.positions), len(self.users)):
+                self.positions[id(self.users[position])] = position
+
+        return self.positions[id(user)]
+
+
+    def add(self, user, post_type, post, question_creation_date=None):
+
+        position = self.get_position(user)
+        self.items[position % self.shard_count].append(
+            (position, post_type, post, question_creation_date))
+
+
+    def get_date_range(self):
+        '''
+        Returns the same as get_activity_date_range, for the posts and reputation events of the
+        partition
+        '''
+        dates = [item[2]['creation_date'] for items in self.items for item in items]
+        for user in self.users:
+            dates += [event['creation_date']
+                      for event in self.reputation_by_user.get(user['user_id'], [])]
+
+        if not dates:
+            return time.time(), time.time()
+
+        return min(dates), max(dates)
+
+
+    def get_shards(self, windows, engine, keep_details, keep_posts):
+
+        shards = []
+        for shard_index, items in enumerate(self.items):
+            positions = list(range(shard_index, len(self.users), self.shard_count))
+            shard_users = [self.users[position] for position in positions]
+            shards.append({
+                'positions': positions,
+                'users': shard_users,
+                'items': items,
+                'reputation_by_user': {user['user_id']: self.reputation_by_user[user['user_id']]
+                                       for user in shard_users
+                                       if user['user_id'] in self.reputation_by_user},
+                'windows': windows,
+                'engine': engine,
+                'keep_details': keep_details,
+                'keep_posts': keep_posts
+            })
+
+        return shards
+
+
+def process_shard(shard):
+    '''
+    Runs in a worker process. Attributes the posts and reputation events of a shard to its users,
+    builds their timelines, and calculates their metrics for each date range. Returns the metrics
+    and answer latency of each date range, and, if requested, the post fields of each user and
+    the shard's post store.
+    '''
+    if isinstance(shard, int): # the worker process was forked, and inherited the shards
+        shard = inherited_shards[shard]
+
+    post_store = initialize_post_store()
+    users = shard['users']
+    users_by_position = dict(zip(shard['positions'], users))
+    for position, post_type, post, question_creation_date in shard['items']:
+        attribute_post(post_store, users_by_position[position], post_type, post,
+                       question_creation_date)
+    users = process_reputation_history(users, shard['reputation_by_user'])
+    timelines = build_user_timelines(users, post_store, shard['engine'])
+
+    shard_windows = {}
+    for start_date, end_date in shard['windows']:
+        shard_windows[(start_date, end_date)] = (
+            list(get_all_window_metrics(timelines, start_date, end_date)),
+            *get_all_window_latency(timelines, start_date, end_date))
+
+    user_posts = None
+    if shard['keep_details']:
+        user_posts = [{field: user[field] for field in USER_POST_FIELDS} for user in users]
+    if not shard['keep_posts']:
+        post_store = None
+
+    return shard['positions'], shard_windows, user_posts, post_store
+
+
+class ShardResults(object):
+    '''
+    The metrics of each date range, calculated by the worker processes of process_shards. Used in
+    place of the timelines by process_users and get_answer_latency_summary, for the same date
+    ranges.
+    '''
+    def __init__(self, user_count, windows):
+
+        self.metrics = {window: [None] * user_count for window in windows}
+        self.latency = {window: ([], []) for window in windows}
+
+
+    def add_shard(self, positions, shard_windows):
+
+        for window, (metrics, answer_latency, first_answer_latency) in shard_windows.items():
+            window_metrics = self.metrics[window]
+            for position, user_metrics in zip(positions, metrics):
+                window_metrics[position] = user_metrics
+            self.latency[window][0].extend(answer_latency)
+            self.latency[window][1].extend(first_answer_latency)
+
+
+    def get_window_metrics(self, start_date, end_date):
+
+        return self.metrics[(start_date, end_date)]
+
+
+    def get_window_latency(self, start_date, end_date):
+
+        answer_latency, first_answer_latency = self.latency[(start_date, end_date)]
+        return sorted(answer_latency), sorted(first_answer_latency)
+
+
+# Fields on the user object that hold the IDs of the user's posts in the post store
+POST_ID_FIELDS = {
+    'questions': 'question_ids',
+    'answers': 'answer_ids',
+    'comments': 'comment_ids',
+    'articles': 'article_ids'
+}
+
+
+# Fields on the user object that are left out of the metrics-only export
+USER_DETAIL_FIELDS = {
+    'question_ids',
+    'answer_ids',
+    'comment_ids',
+    'article_ids',
+    'reputation_history',
+    'answer_response_times',
+    'first_answer_times'
+}
+
+
+# Fields on the user object that are set by attribute_post
+USER_POST_FIELDS = list(POST_ID_FIELDS.values()) + ['answer_response_times', 'first_answer_times']
+
+
+def initialize_post_store():
+
+    return {
+        'questions': {},
+        'answers': {},
+        'comments': {},
+        'articles': {}
+    }
+
+
+def get_user_posts(user, post_store, post_type):
+
+    if post_type == 'reputation_history':
+        return user['reputation_history']
+
+    posts = post_store[post_type]
+    return [posts[post_id] for post_id in user[POST_ID_FIELDS[post_type]]]
 
 
 def add_new_user_fields(users):
 
     for user in users:
-        user['questions'] = []
+        user['question_ids'] = []
         user['question_count'] = 0
         user['questions_with_no_answers'] = 0
         user['question_upvotes'] = 0
         user['question_downvotes'] = 0
 
-        user['answers'] = []
+        user['answer_ids'] = []
         user['answer_count'] = 0
         user['answer_upvotes'] = 0
         user['answer_downvotes'] = 0
         user['answers_accepted'] = 0
         user['answer_response_times'] = []
         user['answer_response_time_median'] = 0
-
-        user['articles'] = []
+        user['answer_response_time_p90'] = 0
+        user['answer_response_time_p99'] = 0
+        user['first_answer_times'] = []
+        user['first_answer_time_median'] = 0
+        user['first_answer_time_p90'] = 0
+        user['first_answer_time_p99'] = 0
+
+        user['article_ids'] = []
         user['article_count'] = 0
         user['article_upvotes'] = 0
 
-        user['comments'] = []
+        user['comment_ids'] = []
         user['comment_count'] = 0
 
         user['total_upvotes'] = 0
@@ -441,105 +1267,116 @@ def add_new_user_fields(users):
     return users
 
 
-def process_reputation_history(users, reputation_history):
+def group_reputation_history(reputation_history):
+    """
+    Groups reputation events by user_id in a single pass. Events keep the order in which they
+    were received from the API."""
+
+    reputation_by_user = {}
+    for event in reputation_history:
+        reputation_by_user.setdefault(event['user_id'], []).append(event)
+
+    return reputation_by_user
+
+
+def process_reputation_history(users, reputation_by_user):
 
     for user in users:
-        for event in reputation_history:
-            if event['user_id'] == user['user_id']:
-                    user['reputation_history'].append(event)
+        user['reputation_history'] += reputation_by_user.get(user['user_id'], [])
 
     return users
 
 
+def build_sme_index(tags):
+    """
+    Builds an inverted index of SME user_id to the names of the tags they're a SME for. Members
+    of SME user groups are expanded into individual users. In some situations, a user may be
+    listed as both an individual SME and a group SME; the tag is only listed once for that user.
+    """
+    sme_index = {}
+    for tag in tags:
+        tag_smes = [sme['id'] for sme in tag['smes']['users']]
+        for group in tag['smes']['userGroups']:
+            if 'users' in group:
+                tag_smes += [member['id'] for member in group['users']]
+            else:
+                # The members couldn't be retrieved (see get_sme_group_members), so the group's
+                # ID is matched against user IDs instead, as it was before groups were expanded
+                print(f"Members of SME user group {group['id']} ({group.get('name', '')}) not "
+                      f"found for tag '{tag['name']}'. Please check the SMEs of this tag.")
+                tag_smes.append(group['id'])
+
+        for sme_id in dict.fromkeys(tag_smes): # individual SMEs first, without duplicates
+            sme_index.setdefault(sme_id, []).append(tag['name'])
+
+    return sme_index
+
+
 def process_tags(users, tags):
     '''
-    Iterate through each tag, find the SMEs, and add the tag name to a new field
-    on the user object, indicating which tags they're a SME for
-    In some situations, a user may be listed as both an individual SME and a group SME
+    Add the names of the tags each user is a SME for to a new field on the user object
     '''
-    for tag in tags:
-        for user in users:
-            for sme in tag['smes']['users']:
-                if user['user_id'] == sme['id']:
-                    user['sme_tags'].append(tag['name'])
-                    continue # if user is an individual SME, skip the group SME check
-            for sme in tag['smes']['userGroups']:
-                if user['user_id'] == sme['id']:
-                    user['sme_tags'].append(tag['name'])
+    sme_index = build_sme_index(tags)
+    for user in users:
+        user['sme_tags'] += sme_index.get(user['user_id'], [])
         
     return users
 
 
-def process_questions(users, questions):
-
+def process_questions(users, questions, user_lookup, attribute):
+    '''
+    Attributes each question, answer, and comment to its owner. attribute(user, post_type, post,
+    question_creation_date) is called for each post; see attribute_post.
+    '''
     for question in questions:
-        asker_id = validate_user_id(question['owner'])
-        user_index = get_user_index(users, asker_id)
+        # attribute_post replaces the nested answers and comments with their IDs
+        answers = question.get('answers')
+        comments = question.get('comments')
 
-        if user_index == None: # if user was deleted, add them to the list
-            deleted_user = initialize_deleted_user(asker_id, question['owner']['display_name'])
-            users.append(deleted_user)
-            user_index = get_user_index(users, asker_id)
-
-        users[user_index]['questions'].append(question)
+        asker_id = validate_user_id(question['owner'])
+        user = get_user(users, user_lookup, asker_id, question['owner'])
+        attribute(user, 'questions', question)
 
-        if question.get('answers'):
-            users = process_answers(users, question['answers'], question)
+        if answers:
+            users = process_answers(users, answers, question, user_lookup, attribute)
 
-        if question.get('comments'):
-            users = process_comments(users, question)
+        if comments:
+            users = process_comments(users, comments, user_lookup, attribute)
 
     return users
 
         
-def process_answers(users, answers, question):
+def process_answers(users, answers, question, user_lookup, attribute):
 
     for answer in answers:
-        answerer_id = validate_user_id(answer['owner'])
-        user_index = get_user_index(users, answerer_id)
-
-        if user_index == None:
-            deleted_user = initialize_deleted_user(answerer_id, answer['owner']['display_name'])
-            users.append(deleted_user)
-            user_index = get_user_index(users, answerer_id)
+        comments = answer.get('comments')
 
-        users[user_index]['answers'].append(answer)
-        answer_response_time_hours = (answer['creation_date'] - question['creation_date'])/60/60
-        users[user_index]['answer_response_times'].append(answer_response_time_hours)
+        answerer_id = validate_user_id(answer['owner'])
+        user = get_user(users, user_lookup, answerer_id, answer['owner'])
+        attribute(user, 'answers', answer, question['creation_date'])
 
-        if answer.get('comments'):
-            users = process_comments(users, answer)
+        if comments:
+            users = process_comments(users, comments, user_lookup, attribute)
 
     return users
 
 
-def process_comments(users, object_with_comments):
+def process_comments(users, comments, user_lookup, attribute):
 
-    for comment in object_with_comments['comments']:
+    for comment in comments:
         commenter_id = validate_user_id(comment['owner'])
-        user_index = get_user_index(users, commenter_id)
-
-        if user_index == None:
-            deleted_user = initialize_deleted_user(commenter_id, comment['owner']['display_name'])
-            users.append(deleted_user)
-            user_index = get_user_index(users, commenter_id)
-
-        users[user_index]['comments'].append(comment)
+        user = get_user(users, user_lookup, commenter_id, comment['owner'])
+        attribute(user, 'comments', comment)
 
     return users
 
 
-def process_articles(users, articles):
+def process_articles(users, articles, user_lookup, attribute):
 
     for article in articles:
         author_id = validate_user_id(article['owner'])
-        user_index = get_user_index(users, author_id)
-        if user_index == None:
-            deleted_user = initialize_deleted_user(author_id, article['owner']['display_name'])
-            users.append(deleted_user)
-            user_index = get_user_index(users, author_id)
-
-        users[user_index]['articles'].append(article)
+        user = get_user(users, user_lookup, author_id, article['owner'])
+        attribute(user, 'articles', article)
 
         # As of 2023.05.23, Article comments are slightly innaccurate due to a bug in the API
         # if article.get('comments'):
@@ -552,49 +1389,229 @@ def process_articles(users, articles):
     return users
 
 
-def process_users(users, start_date, end_date):
+def attribute_post(post_store, user, post_type, post, question_creation_date=None):
+    '''
+    Adds a post to the post store and its ID to the user. For questions, the time to first answer
+    is added to the asker. For answers, the response time is added to the answerer.
+
+    The post itself is stored, rather than a copy, so the API data isn't held in memory twice.
+    Its nested answers and comments are removed from it, since those are stored in their own
+    tables, and questions and answers keep their IDs instead.
+    '''
+    post_id = post[POST_ID_FIELDS[post_type][:-1]] # e.g. 'question_ids' -> 'question_id'
+    user[POST_ID_FIELDS[post_type]].append(post_id)
+    post_store[post_type][post_id] = post
+    answers = post.pop('answers', [])
+    comments = post.pop('comments', [])
 
+    if post_type in ('questions', 'answers'):
+        post['comment_ids'] = [comment['comment_id'] for comment in comments]
 
+    if post_type == 'questions':
+        post['answer_ids'] = [answer['answer_id'] for answer in answers]
+
+        # Answers created before the question (e.g. from merged questions) are ignored
+        answer_times = [answer['creation_date'] - post['creation_date']
+                        for answer in answers]
+        answer_times = [answer_time for answer_time in answer_times if answer_time > 0]
+        if answer_times:
+            first_answer_time_hours = min(answer_times)/60/60
+            user['first_answer_times'].append([post['creation_date'], first_answer_time_hours])
+
+    elif post_type == 'answers':
+        answer_response_time_hours = (post['creation_date'] - question_creation_date)/60/60
+        user['answer_response_times'].append([post['creation_date'], answer_response_time_hours])
+
+
+def build_user_timelines(users, post_store, engine='python'):
+    """
+    For each user, sorts their posts and reputation events by creation date and calculates
+    running totals of the metrics in the report. This allows the metrics for any date range to be
+    found with a binary search, rather than checking every post. The list of timelines is in the
+    same order as the list of users.
+    
+    If the 'numpy' engine is used, the posts of all users are instead flattened into arrays, and
+    the metrics for each date range are calculated with vectorized operations."""
+
+    if engine == 'numpy':
+        return so4t_columnar.build_user_columns(
+            users, lambda user, post_type: get_user_posts(user, post_store, post_type))
+
+    timelines = []
     for user in users:
-        for question in user['questions']:
-            if question['creation_date'] > start_date and question['creation_date'] < end_date:
-                user['question_count'] += 1
-                user['question_upvotes'] += question['up_vote_count']
-                user['question_downvotes'] += question['down_vote_count']
-                if question['answer_count'] == 0:
-                    user['questions_with_no_answers'] += 1
-
-        for answer in user['answers']:
-            if answer['creation_date'] > start_date and answer['creation_date'] < end_date:
-                user['answer_count'] += 1
-                user['answer_upvotes'] += answer['up_vote_count']
-                user['answer_downvotes'] += answer['down_vote_count']
-                if answer['is_accepted']:
-                    user['answers_accepted'] += 1
-
-        for article in user['articles']:
-            if article['creation_date'] > start_date and article['creation_date'] < end_date:
-                user['article_count'] += 1
-                user['article_upvotes'] += article['score']
-
-        for comment in user['comments']:
-            if comment['creation_date'] > start_date and comment['creation_date'] < end_date:
-                user['comment_count'] += 1
-
-        for event in user['reputation_history']:
-            if event['creation_date'] > start_date and event['creation_date'] < end_date:
-                user['net_reputation'] += event['reputation_change']
-
-        for answer_response_time in user['answer_response_times']:
-            if answer_response_time <= 0:
-                user['answer_response_times'].remove(answer_response_time)
-
-        if user['answer_response_times']:
-            user['answer_response_time_median'] = round(
-                statistics.median(user['answer_response_times']), 2)
+        timelines.append({
+            'questions': build_timeline(get_user_posts(user, post_store, 'questions'), {
+                'upvotes': lambda question: question['up_vote_count'],
+                'downvotes': lambda question: question['down_vote_count'],
+                'no_answers': lambda question: question['answer_count'] == 0
+            }),
+            'answers': build_timeline(get_user_posts(user, post_store, 'answers'), {
+                'upvotes': lambda answer: answer['up_vote_count'],
+                'downvotes': lambda answer: answer['down_vote_count'],
+                'accepted': lambda answer: bool(answer['is_accepted'])
+            }),
+            'articles': build_timeline(get_user_posts(user, post_store, 'articles'), {
+                'upvotes': lambda article: article['score']
+            }),
+            'comments': build_timeline(get_user_posts(user, post_store, 'comments'), {}),
+            'reputation_history': build_timeline(user['reputation_history'], {
+                'reputation_change': lambda event: event['reputation_change']
+            }),
+            'answer_latency': build_latency_timeline(user['answer_response_times']),
+            'first_answer_latency': build_latency_timeline(user['first_answer_times'])
+        })
+
+    return timelines
+
+
+def build_latency_timeline(response_times):
+    """
+    Sorts [creation date, hours] pairs by creation date, ignoring non-positive response times"""
+
+    response_times = sorted(response_time for response_time in response_times
+                            if response_time[1] > 0)
+
+    return {
+        'dates': [response_time[0] for response_time in response_times],
+        'hours': [response_time[1] for response_time in response_times]
+    }
+
+
+def build_timeline(items, metrics):
+
+    items = sorted(items, key=lambda item: item['creation_date'])
+    timeline = {'dates': [item['creation_date'] for item in items]}
+    for metric, get_value in metrics.items():
+        timeline[metric] = list(itertools.accumulate(
+            (get_value(item) for item in items), initial=0))
+
+    return timeline
+
+
+def get_window_totals(timeline, start_date, end_date):
+    """
+    Returns the count of items, and the total of each metric, created after start_date and
+    before end_date."""
+
+    first, last = get_window_bounds(timeline, start_date, end_date)
+
+    totals = {'count': last - first}
+    for metric, running_totals in timeline.items():
+        if metric != 'dates':
+            totals[metric] = running_totals[last] - running_totals[first]
+
+    return totals
+
+
+def get_window_bounds(timeline, start_date, end_date):
+
+    first = bisect.bisect_right(timeline['dates'], start_date)
+    last = max(bisect.bisect_left(timeline['dates'], end_date), first)
+
+    return first, last
+
+
+def get_window_latency(timeline, start_date, end_date):
+    """
+    Returns the sorted response times (in hours) created after start_date and before end_date"""
+
+    first, last = get_window_bounds(timeline, start_date, end_date)
+
+    return sorted(timeline['hours'][first:last])
+
+
+def get_percentile(sorted_values, percentile):
+    """
+    Returns the percentile of a sorted list of values, using linear interpolation between the
+    closest ranks. The NumPy engine uses the same calculation, so both give identical results."""
+
+    position = (len(sorted_values) - 1) * (percentile / 100)
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = position - lower
+
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
+
+
+def get_latency_metrics(prefix, sorted_hours):
+
+    metrics = {}
+    for name, percentile in [('median', 50), ('p90', 90), ('p99', 99)]:
+        if sorted_hours:
+            metrics[f'{prefix}_{name}'] = round(get_percentile(sorted_hours, percentile), 2)
         else:
-            user['answer_response_time_median'] = ''
+            metrics[f'{prefix}_{name}'] = ''
+
+    return metrics
+
+
+def get_window_metrics(timeline, start_date, end_date):
+
+    questions = get_window_totals(timeline['questions'], start_date, end_date)
+    answers = get_window_totals(timeline['answers'], start_date, end_date)
+    articles = get_window_totals(timeline['articles'], start_date, end_date)
+    comments = get_window_totals(timeline['comments'], start_date, end_date)
+    reputation = get_window_totals(timeline['reputation_history'], start_date, end_date)
+    answer_latency = get_window_latency(timeline['answer_latency'], start_date, end_date)
+    first_answer_latency = get_window_latency(
+        timeline['first_answer_latency'], start_date, end_date)
+
+    metrics = {
+        'question_count': questions['count'],
+        'question_upvotes': questions['upvotes'],
+        'question_downvotes': questions['downvotes'],
+        'questions_with_no_answers': questions['no_answers'],
+        'answer_count': answers['count'],
+        'answer_upvotes': answers['upvotes'],
+        'answer_downvotes': answers['downvotes'],
+        'answers_accepted': answers['accepted'],
+        'article_count': articles['count'],
+        'article_upvotes': articles['upvotes'],
+        'comment_count': comments['count'],
+        'net_reputation': reputation['reputation_change']
+    }
+    metrics.update(get_latency_metrics('answer_response_time', answer_latency))
+    metrics.update(get_latency_metrics('first_answer_time', first_answer_latency))
+
+    return metrics
+
+
+def get_all_window_metrics(timelines, start_date, end_date):
+    """
+    Returns the metrics of every user for a date range, in the same order as the list of users"""
 
+    if isinstance(timelines, ShardResults):
+        return timelines.get_window_metrics(start_date, end_date)
+    elif isinstance(timelines, so4t_columnar.UserColumns):
+        return so4t_columnar.get_window_metrics(timelines, start_date, end_date)
+    else:
+        return (get_window_metrics(timeline, start_date, end_date) for timeline in timelines)
+
+
+def get_all_window_latency(timelines, start_date, end_date):
+    """
+    Returns sorted lists of every answer response time and time to first answer, in hours, for
+    answers and questions created after start_date and before end_date"""
+
+    if isinstance(timelines, ShardResults):
+        return timelines.get_window_latency(start_date, end_date)
+    elif isinstance(timelines, so4t_columnar.UserColumns):
+        return so4t_columnar.get_window_latency(timelines, start_date, end_date)
+    else:
+        answer_latency = sorted(itertools.chain.from_iterable(
+            get_window_latency(timeline['answer_latency'], start_date, end_date)
+            for timeline in timelines))
+        first_answer_latency = sorted(itertools.chain.from_iterable(
+            get_window_latency(timeline['first_answer_latency'], start_date, end_date)
+            for timeline in timelines))
+        return answer_latency, first_answer_latency
+
+
+def process_users(users, start_date, end_date, timelines):
+
+    window_metrics = get_all_window_metrics(timelines, start_date, end_date)
+    for user, metrics in zip(users, window_metrics):
+        user.update(metrics)
         user['total_upvotes'] = user['question_upvotes'] + user['answer_upvotes'] + \
             user['article_upvotes']
         user['total_downvotes'] = user['question_downvotes'] + user['answer_downvotes']
@@ -602,6 +1619,21 @@ def process_users(users, start_date, end_date):
     return users
 
 
+def get_answer_latency_summary(timelines, start_date, end_date):
+    """
+    Returns the instance-wide percentiles of the answer response times and the time to first
+    answer, for answers and questions created after start_date and before end_date."""
+
+    answer_latency, first_answer_latency = get_all_window_latency(timelines, start_date,
+                                                                  end_date)
+
+    summary = {'answer_count': len(answer_latency), 'question_count': len(first_answer_latency)}
+    summary.update(get_latency_metrics('answer_response_time', answer_latency))
+    summary.update(get_latency_metrics('first_answer_time', first_answer_latency))
+
+    return summary
+
+
 def create_user_report(users, start_date, end_date, output_name):
 
     # Create a list of user dictionaries, sorted by net reputation
@@ -619,6 +1651,10 @@ def create_user_report(users, start_date, end_date, output_name):
 
             'Questions': safe_get_user_field(user, 'question_count', 0),
             'Questions With No Answers': safe_get_user_field(user, 'questions_with_no_answers', 0),
+            'Median Time to First Answer (Hours)': safe_get_user_field(
+                user, 'first_answer_time_median', ''),
+            'P90 Time to First Answer (Hours)': safe_get_user_field(user, 'first_answer_time_p90', ''),
+            'P99 Time to First Answer (Hours)': safe_get_user_field(user, 'first_answer_time_p99', ''),
             # 'Question Upvotes': user['question_upvotes'],
             # 'Question Downvotes': user['question_downvotes'],
 
@@ -627,6 +1663,8 @@ def create_user_report(users, start_date, end_date, output_name):
             # 'Answer Downvotes': user['answer_downvotes'],
             'Answers Accepted': safe_get_user_field(user, 'answers_accepted', 0),
             'Median Answer Time (Hours)': safe_get_user_field(user, 'answer_response_time_median', 0),
+            'P90 Answer Time (Hours)': safe_get_user_field(user, 'answer_response_time_p90', ''),
+            'P99 Answer Time (Hours)': safe_get_user_field(user, 'answer_response_time_p99', ''),
 
             'Articles': safe_get_user_field(user, 'article_count', 0),
             # 'Article Upvotes': user['article_upvotes'],
@@ -654,21 +1692,64 @@ def create_user_report(users, start_date, end_date, output_name):
     
 
     # Export user metrics to CSV
+    export_to_csv(get_report_name('user_metrics', start_date, end_date, output_name),
+                  user_metrics)
+
+
+def create_answer_latency_report(latency, start_date, end_date, output_name):
+
+    latency_metrics = []
+    for label, prefix, count_field in [('Answer Time (Hours)', 'answer_response_time', 'answer_count'),
+                                       ('Time to First Answer (Hours)', 'first_answer_time',
+                                        'question_count')]:
+        latency_metrics.append({
+            'Metric': label,
+            'Count': latency[count_field],
+            'Median': latency[f'{prefix}_median'],
+            'P90': latency[f'{prefix}_p90'],
+            'P99': latency[f'{prefix}_p99']
+        })
+        print(f"Instance-wide {label}: median {latency[f'{prefix}_median']}, "
+              f"p90 {latency[f'{prefix}_p90']}, p99 {latency[f'{prefix}_p99']}")
+
+    export_to_csv(get_report_name('answer_latency', start_date, end_date, output_name),
+                  latency_metrics)
+
+
+def get_report_name(data_name, start_date, end_date, output_name):
+
     if output_name:
-        export_to_csv(f'user_metrics_{output_name}', user_metrics)
+        return f'{data_name}_{output_name}'
     elif start_date and end_date:
-        export_to_csv(f'user_metrics_{start_date}_to_{end_date}', user_metrics)
+        return f'{data_name}_{start_date}_to_{end_date}'
     else:
-        export_to_csv('user_metrics', user_metrics)
+        return data_name
 
 
-def get_user_index(users, user_id):
+def build_user_lookup(users):
+    """
+    Creates a dictionary of users keyed by user_id, so that each post can be attributed to its
+    owner without scanning the entire list of users."""
 
-    for index, user in enumerate(users):
-        if user['user_id'] == user_id:
-            return index
-    
-    return None # if user is not found
+    user_lookup = {}
+    for user in users:
+        user_lookup.setdefault(user['user_id'], user) # keep the first user if an ID is repeated
+
+    return user_lookup
+
+
+def get_user(users, user_lookup, user_id, owner):
+    """
+    Returns the user with the given user_id. If the user is not found, they were deleted; a
+    placeholder user is created and added to both the list of users and the lookup dictionary."""
+
+    user = user_lookup.get(user_id)
+    if user is None: # if user was deleted, add them to the list
+        user = initialize_deleted_user(user_id, owner['display_name'])
+        users.append(user)
+        user_lookup[user_id] = user
+
+    return user
 
 
 def initialize_deleted_user(user_id, display_name):
@@ -677,24 +1758,25 @@ def initialize_deleted_user(user_id, display_name):
         'user_id': user_id,
         'display_name': f"{display_name} (DELETED)",
 
-        'questions': [],
+        'question_ids': [],
         'question_count': 0,
         'questions_with_no_answers': 0,
         'question_upvotes': 0,
         'question_downvotes': 0,
 
-        'answers': [],
+        'answer_ids': [],
         'answer_count': 0,
         'answer_upvotes': 0,
         'answer_downvotes': 0,
         'answers_accepted': 0,
         'answer_response_times': [],
+        'first_answer_times': [],
 
-        'articles': [],
+        'article_ids': [],
         'article_count': 0,
         'article_upvotes': 0,
 
-        'comments': [],
+        'comment_ids': [],
         'comment_count': 0,
 
         'total_upvotes': 0,
@@ -750,6 +1832,11 @@ def validate_user_id(user):
     return user_id
 
 
+def date_to_timestamp(date_string):
+
+    return int(time.mktime(time.strptime(date_string, '%Y-%m-%d')))
+
+
 def export_to_csv(data_name, data):
 
     date = time.strftime("%Y-%m-%d")
@@ -765,7 +1852,7 @@ def export_to_csv(data_name, data):
     print(f'CSV file created: {file_name}')
 
 
-def export_to_json(data_name, data):
+def export_to_json(data_name, data, indent=4):
     
     file_name = data_name + '.json'
     directory = 'data'
@@ -775,25 +1862,165 @@ def export_to_json(data_name, data):
     file_path = os.path.join(directory, file_name)
 
     with open(file_path, 'w') as f:
-        json.dump(data, f, indent=4)
+        json.dump(data, f, indent=indent)
+
+    print(f'JSON file created: {file_name}')
+
+
+def export_to_json_stream(data_name, items):
+    """
+    Writes an iterable of items to a JSON array one item at a time, so that only one item needs
+    to be in memory at once. The output can be read with read_json."""
+
+    file_name = data_name + '.json'
+    directory = 'data'
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    file_path = os.path.join(directory, file_name)
+
+    with open(file_path, 'w') as f:
+        f.write('[')
+        for index, item in enumerate(items):
+            if index:
+                f.write(',')
+            f.write('\n')
+            json.dump(item, f)
+        f.write('\n]\n')
 
     print(f'JSON file created: {file_name}')
 
 
-def read_json(file_name):
+def export_to_ndjson(data_name, items):
+    """
+    Writes items to an NDJSON file, one JSON record per line, as they're iterated. Unlike a JSON
+    array, the file can be appended to, and read one record at a time with read_ndjson."""
+
+    file_name = data_name + '.ndjson'
+    directory = 'data'
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    file_path = os.path.join(directory, file_name)
+
+    with open(file_path, 'w') as f:
+        for item in items:
+            f.write(json.dumps(item) + '\n')
+
+    print(f'NDJSON file created: {file_name}')
+
+
+def read_dataset(data_name):
+    """
+    Returns the records of a dataset saved in the data directory, from the NDJSON file
+    (data_name.ndjson) if there is one, or else from the JSON file (data_name.json). If both
+    exist, the most recently written one is used."""
+
+    directory = 'data'
+    ndjson_path = os.path.join(directory, data_name + '.ndjson')
+    json_path = os.path.join(directory, data_name + '.json')
+    use_ndjson = os.path.exists(ndjson_path)
+    if use_ndjson and os.path.exists(json_path):
+        use_ndjson = os.path.getmtime(ndjson_path) >= os.path.getmtime(json_path)
+    if use_ndjson:
+        return read_ndjson(data_name + '.ndjson')
+
+    return read_json(data_name + '.json')
+
+
+def read_ndjson(file_name):
+    """
+    Returns an iterator over the records of an NDJSON file in the data directory. The file is
+    read one line at a time, so only one record needs to be in memory at once.
+
+    Unlike json.load, which shares the key strings of all the objects in a file, each line is
+    decoded separately, so keys are interned to keep the records that are held onto (such as
+    reputation events) as small as they'd be when loaded from a JSON file."""
+
+    directory = 'data'
+    file_path = os.path.join(directory, file_name)
+    try:
+        f = open(file_path, 'r')
+    except FileNotFoundError:
+        print(f"File not found: {file_path}")
+        raise FileNotFoundError
+
+    decoder = json.JSONDecoder(
+        object_pairs_hook=lambda pairs: {sys.intern(key): value for key, value in pairs})
+
+    def read_records():
+        with f:
+            for line in f:
+                if line.strip():
+                    yield decoder.decode(line)
+
+    return read_records()
+
+
+def read_json(file_name, use_load_cache=True):
+    """
+    Reads a JSON file from the data directory. The parsed data is also saved to a binary sidecar
+    file (the file name plus .pickle), which is used instead of parsing the JSON file again, for
+    as long as the JSON file has the same modification time and size. With use_load_cache set to
+    False, the JSON file is always parsed, and the sidecar file is neither read nor written."""
     
     directory = 'data'
     file_path = os.path.join(directory, file_name)
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        source_stat = os.stat(file_path)
     except FileNotFoundError:
         print(f"File not found: {file_path}")
         raise FileNotFoundError
+
+    # The garbage collector is paused while loading, since the millions of objects created
+    # would otherwise trigger repeated collections that find nothing to collect
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        data = read_load_cache(file_path, source_stat) if use_load_cache else None
+        if data is None:
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+            if use_load_cache:
+                write_load_cache(file_path, source_stat, data)
+    finally:
+        if gc_enabled:
+            gc.enable()
     
     return data
 
 
+def read_load_cache(file_path, source_stat):
+    """
+    Returns the data saved in the sidecar file of a JSON file, or None if there isn't one or it
+    was saved from a different version of the JSON file"""
+
+    try:
+        with open(file_path + '.pickle', 'rb') as f:
+            source = pickle.load(f)
+            if source != {'mtime': source_stat.st_mtime_ns, 'size': source_stat.st_size}:
+                return None
+            return pickle.load(f)
+    except Exception: # missing, incomplete, or unreadable; it's replaced after parsing the JSON
+        return None
+
+
+def write_load_cache(file_path, source_stat, data):
+
+    cache_path = file_path + '.pickle'
+    temp_path = f'{cache_path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            # The modification time and size of the JSON file come first, so a sidecar file for
+            # a different version of it can be detected without loading the data
+            pickle.dump({'mtime': source_stat.st_mtime_ns, 'size': source_stat.st_size}, f)
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError: # e.g. a read-only data directory; the JSON file is parsed every time
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
 if __name__ == '__main__':
 
     main()